@@ -0,0 +1,22 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+@click.command("generate-archive-key")
+@pass_context
+def generate_archive_key(context):
+	"""Generate the archive file encryption key in site config"""
+	site = get_site(context)
+	frappe.init(site=site)
+	
+	try:
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_document.utils import ensure_encryption_key
+		
+		if ensure_encryption_key():
+			click.echo(f"Archive encryption key generated for {site}")
+		else:
+			click.echo(f"Archive encryption key already configured for {site}")
+	finally:
+		frappe.destroy()
+
+commands = [generate_archive_key]
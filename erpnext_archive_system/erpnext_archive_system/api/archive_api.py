@@ -1,12 +1,206 @@
 import frappe
 from frappe import _
 import json
-from frappe.utils import cstr, now
+from frappe.utils import cint, cstr, now
 from frappe.model.document import Document
-import base64
+from erpnext_archive_system.erpnext_archive_system.config.archive_config import ArchiveConfig
+import functools
 import hashlib
+import mimetypes
+import os
+import re
 from datetime import datetime, timedelta
 
+# Use the SIMD accelerated decoder from pybase64 when it is installed
+try:
+	from pybase64 import b64decode as _b64decode
+except ImportError:
+	from base64 import b64decode as _b64decode
+
+# Parse JSON arguments with orjson when it is installed
+try:
+	from orjson import loads as _loads
+except ImportError:
+	from json import loads as _loads
+
+# Base64 input is decoded in slices of this many characters (a multiple of 4)
+BASE64_CHUNK_SIZE = 64 * 1024
+
+def decode_file_data(file_data):
+	"""Decode base64 file data in one pass, returning the raw bytes and their SHA-256 hash"""
+	chunks = []
+	sha256 = hashlib.sha256()
+	
+	# Line wrapped (MIME) input is unwrapped first, so every slice holds whole 4 character groups
+	file_data = "".join(file_data.split())
+	
+	for start in range(0, len(file_data), BASE64_CHUNK_SIZE):
+		chunk = _b64decode(file_data[start:start + BASE64_CHUNK_SIZE], validate=False)
+		# hashlib hashes in OpenSSL (SHA-NI where available) while the slice is still hot
+		sha256.update(chunk)
+		chunks.append(chunk)
+	
+	# A single join copies every chunk once into an exactly sized bytes object
+	return b"".join(chunks), sha256.hexdigest()
+
+# Cache keys of the dashboard lookups, cleared by the doctypes they are built from
+ARCHIVE_STATISTICS_CACHE_KEY = "archive_statistics"
+ARCHIVE_CATEGORIES_CACHE_KEY = "archive_categories"
+ARCHIVE_DOCUMENT_TYPES_CACHE_KEY = "archive_document_types"
+ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY = "archive_document_type_statistics"
+
+# Redis hash of is_active by category name, cleared per category when it changes
+ARCHIVE_CATEGORY_ACTIVE_CACHE_KEY = "archive_category_active"
+
+def get_cached_value(key, generator):
+	"""Return a cached value, generating and caching it for cache_ttl_seconds on a miss"""
+	performance_settings = ArchiveConfig.get_performance_settings()
+	if not performance_settings["enable_caching"]:
+		return generator()
+	
+	value = frappe.cache().get_value(key)
+	if value is None:
+		value = generator()
+		frappe.cache().set_value(key, value, expires_in_sec=cint(performance_settings["cache_ttl_seconds"]))
+	
+	return value
+
+# Words shorter than innodb_ft_min_token_size are not in the FULLTEXT index
+FULLTEXT_MIN_WORD_LENGTH = 3
+
+def get_fulltext_search_term(search_term):
+	"""Build a boolean mode AGAINST expression, or None when the FULLTEXT index cannot serve the term"""
+	if frappe.db.db_type != "mariadb":
+		return None
+	
+	words = re.findall(r"\w+", search_term)
+	if not words or any(len(word) < FULLTEXT_MIN_WORD_LENGTH for word in words):
+		return None
+	
+	return " ".join(f"+{word}*" for word in words)
+
+def escape_like(value):
+	"""Escape LIKE wildcards so the value is matched literally"""
+	return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Archive Document columns that search_documents accepts as filters
+SEARCH_FILTER_FIELDS = frozenset((
+	"document_type", "category", "subcategory", "status", "priority",
+	"access_level", "encryption_status", "compliance_status"
+))
+
+def build_search_conditions(search_term, filters):
+	"""Resolve the query shape and the parameters for a search"""
+	params = []
+	search_mode = None
+	
+	if search_term:
+		fulltext_term = get_fulltext_search_term(search_term)
+		document_id_param = f"{escape_like(search_term)}%"
+		
+		if fulltext_term:
+			search_mode = "fulltext"
+			params.extend([fulltext_term, document_id_param])
+		else:
+			search_mode = "like"
+			search_param = f"%{search_term}%"
+			params.extend([search_param, document_id_param, search_param, search_param, search_param])
+	
+	# Filters are sorted so every request with the same keys shares one query
+	filter_fields = []
+	for field, value in sorted((filters or {}).items()):
+		if not value:
+			continue
+		
+		if field not in SEARCH_FILTER_FIELDS:
+			frappe.throw(_("Cannot filter documents by {0}").format(field))
+		
+		is_list = isinstance(value, (list, tuple))
+		filter_fields.append((field, is_list))
+		params.append(tuple(value) if is_list else value)
+	
+	return search_mode, tuple(filter_fields), params
+
+@functools.lru_cache(maxsize=None)
+def get_search_query(search_mode, filter_fields):
+	"""Build the page and count SQL for a search shape, cached per shape"""
+	joins = ""
+	conditions = ""
+	
+	# Narrow down to FULLTEXT matches before joining and filtering
+	if search_mode == "fulltext":
+		joins = """
+			INNER JOIN (
+				SELECT name FROM `tabArchive Document`
+				WHERE MATCH(document_title, ocr_text, tags, description) AGAINST (%s IN BOOLEAN MODE)
+				UNION
+				SELECT name FROM `tabArchive Document`
+				WHERE document_id LIKE %s
+			) matches ON matches.name = ad.name
+		"""
+	elif search_mode == "like":
+		conditions += """
+			AND (ad.document_title LIKE %s 
+			OR ad.document_id LIKE %s 
+			OR ad.ocr_text LIKE %s 
+			OR ad.tags LIKE %s
+			OR ad.description LIKE %s)
+		"""
+	
+	for field, is_list in filter_fields:
+		conditions += f" AND ad.{field} IN %s" if is_list else f" AND ad.{field} = %s"
+	
+	columns = """
+			ad.name,
+			ad.document_id,
+			ad.document_title,
+			ad.category,
+			ad.subcategory,
+			ad.status,
+			ad.access_level,
+			ad.created_on,
+			ad.last_modified_on,
+			adt.document_type_name,
+			ac.category_name
+	"""
+	
+	if not search_mode and not filter_fields:
+		# The latest documents listing pages through the created_on index alone
+		# and only joins the rows of the requested page
+		query = f"""
+			SELECT {columns}
+			FROM (
+				SELECT name FROM `tabArchive Document`
+				ORDER BY created_on DESC
+				LIMIT %s OFFSET %s
+			) page
+			INNER JOIN `tabArchive Document` ad ON ad.name = page.name
+			LEFT JOIN `tabArchive Document Type` adt ON ad.document_type = adt.name
+			LEFT JOIN `tabArchive Category` ac ON ad.category = ac.name
+			ORDER BY ad.created_on DESC
+		"""
+	else:
+		query = f"""
+			SELECT {columns}
+			FROM `tabArchive Document` ad
+			LEFT JOIN `tabArchive Document Type` adt ON ad.document_type = adt.name
+			LEFT JOIN `tabArchive Category` ac ON ad.category = ac.name
+			{joins}
+			WHERE 1=1 {conditions}
+			ORDER BY ad.created_on DESC
+			LIMIT %s OFFSET %s
+		"""
+	
+	# The lookup joins do not change the row count
+	count_query = f"""
+		SELECT COUNT(*) as total
+		FROM `tabArchive Document` ad
+		{joins}
+		WHERE 1=1 {conditions}
+	"""
+	
+	return query, count_query
+
 @frappe.whitelist(allow_guest=False)
 def upload_document(file_data, document_title, document_type, category, **kwargs):
 	"""Upload and process a new document"""
@@ -16,18 +210,19 @@ def upload_document(file_data, document_title, document_type, category, **kwargs
 			return {"status": "error", "message": "Missing required fields"}
 		
 		# Decode file data
-		file_content = base64.b64decode(file_data)
-		file_hash = hashlib.sha256(file_content).hexdigest()
+		file_content, file_hash = decode_file_data(file_data)
 		
-		# Create file document
+		# Every upload gets its own File row owned by the uploader, another
+		# document's attachment is never reused for identical content
 		file_doc = frappe.get_doc({
 			"doctype": "File",
 			"file_name": kwargs.get("file_name", "document"),
-			"file_size": len(file_content),
-			"content": file_data,
+			"content": file_content,
+			"decode": False,
 			"is_private": 1
 		})
 		file_doc.insert(ignore_permissions=True)
+		file_url = file_doc.file_url
 		
 		# Generate document ID
 		from erpnext_archive_system.erpnext_archive_system.doctype.archive_document.utils import generate_document_id
@@ -42,7 +237,8 @@ def upload_document(file_data, document_title, document_type, category, **kwargs
 			"category": category,
 			"subcategory": kwargs.get("subcategory"),
 			"description": kwargs.get("description", ""),
-			"file_attachment": file_doc.file_url,
+			"file_attachment": file_url,
+			"file_hash": file_hash,
 			"access_level": kwargs.get("access_level", "Internal"),
 			"status": "Active",
 			"priority": kwargs.get("priority", "Medium"),
@@ -50,15 +246,11 @@ def upload_document(file_data, document_title, document_type, category, **kwargs
 			"retention_period": kwargs.get("retention_period", 7)
 		})
 		
+		archive_doc.flags.auto_categorize = kwargs.get("auto_categorize", True)
 		archive_doc.insert(ignore_permissions=True)
 		
-		# Process OCR if required
-		if kwargs.get("process_ocr", False):
-			archive_doc.process_ocr()
-			archive_doc.save()
-		
-		# Auto categorize if enabled
-		if kwargs.get("auto_categorize", True):
+		# OCR of the new file is queued by the save, which also categorizes once the text is in
+		if archive_doc.flags.auto_categorize and not archive_doc.flags.files_queued:
 			from erpnext_archive_system.erpnext_archive_system.doctype.archive_category.archive_category import auto_categorize_document
 			auto_categorize_document(archive_doc.name)
 		
@@ -66,7 +258,7 @@ def upload_document(file_data, document_title, document_type, category, **kwargs
 			"status": "success",
 			"document_id": archive_doc.document_id,
 			"archive_id": archive_doc.name,
-			"file_url": file_doc.file_url,
+			"file_url": file_url,
 			"message": "Document uploaded successfully"
 		}
 		
@@ -80,61 +272,20 @@ def search_documents(search_term="", filters=None, limit=20, offset=0):
 	try:
 		# Parse filters if provided as JSON string
 		if isinstance(filters, str):
-			filters = json.loads(filters)
-		
-		# Build query
-		query = """
-			SELECT 
-				ad.name,
-				ad.document_id,
-				ad.document_title,
-				ad.category,
-				ad.subcategory,
-				ad.status,
-				ad.access_level,
-				ad.created_on,
-				ad.last_modified_on,
-				adt.document_type_name,
-				ac.category_name
-			FROM `tabArchive Document` ad
-			LEFT JOIN `tabArchive Document Type` adt ON ad.document_type = adt.name
-			LEFT JOIN `tabArchive Category` ac ON ad.category = ac.name
-			WHERE 1=1
-		"""
-		
-		params = []
-		
-		# Add search term
-		if search_term:
-			query += """
-				AND (ad.document_title LIKE %s 
-				OR ad.document_id LIKE %s 
-				OR ad.ocr_text LIKE %s 
-				OR ad.tags LIKE %s
-				OR ad.description LIKE %s)
-			"""
-			search_param = f"%{search_term}%"
-			params.extend([search_param, search_param, search_param, search_param, search_param])
+			filters = _loads(filters)
 		
-		# Add filters
-		if filters:
-			for field, value in filters.items():
-				if value:
-					query += f" AND ad.{field} = %s"
-					params.append(value)
+		search_mode, filter_fields, params = build_search_conditions(search_term, filters)
+		query, count_query = get_search_query(search_mode, filter_fields)
 		
-		# Add ordering and pagination
-		query += " ORDER BY ad.created_on DESC LIMIT %s OFFSET %s"
-		params.extend([limit, offset])
+		limit, offset = cint(limit), cint(offset)
+		documents = frappe.db.sql(query, params + [limit, offset], as_dict=True)
 		
-		documents = frappe.db.sql(query, params, as_dict=True)
-		
-		# Get total count for pagination
-		count_query = query.replace("SELECT ad.name, ad.document_id, ad.document_title, ad.category, ad.subcategory, ad.status, ad.access_level, ad.created_on, ad.last_modified_on, adt.document_type_name, ac.category_name", "SELECT COUNT(*) as total")
-		count_query = count_query.replace("ORDER BY ad.created_on DESC LIMIT %s OFFSET %s", "")
-		count_params = params[:-2]  # Remove limit and offset
-		
-		total_count = frappe.db.sql(count_query, count_params, as_dict=True)[0].total
+		# A short page is the last one, so the total is known without counting
+		if len(documents) < limit and (documents or not offset):
+			total_count = offset + len(documents)
+		else:
+			# Get total count for pagination
+			total_count = frappe.db.sql(count_query, params, as_dict=True)[0].total
 		
 		return {
 			"status": "success",
@@ -149,65 +300,55 @@ def search_documents(search_term="", filters=None, limit=20, offset=0):
 		return {"status": "error", "message": str(e)}
 
 @frappe.whitelist(allow_guest=False)
-def get_document_details(document_id):
+def get_document_details(document_id, include_children=True):
 	"""Get detailed information about a document"""
 	try:
 		# Get document
-		document = frappe.get_doc("Archive Document", document_id)
+		document = frappe.db.sql("""
+			SELECT 
+				name, document_id, document_title, document_type, category, subcategory,
+				description, status, priority, access_level, file_attachment, ocr_text,
+				tags, retention_period, encryption_status, compliance_status,
+				created_by, created_on, last_modified_by, last_modified_on
+			FROM `tabArchive Document`
+			WHERE name = %s
+		""", (document_id,), as_dict=True)
 		
-		# Get related documents
-		related_docs = []
-		for rel in document.related_documents:
-			related_docs.append({
-				"related_document_id": rel.related_document_id,
-				"relationship_type": rel.relationship_type,
-				"notes": rel.notes
-			})
+		if not document:
+			return {"status": "error", "message": "Document not found"}
 		
-		# Get version history
+		# Related documents and versions are skipped when the panel is collapsed
+		related_docs = []
 		versions = []
-		for ver in document.version_info:
-			versions.append({
-				"version_number": ver.version_number,
-				"version_date": ver.version_date,
-				"version_notes": ver.version_notes,
-				"file_size": ver.file_size,
-				"created_by": ver.created_by,
-				"is_current_version": ver.is_current_version
-			})
+		if frappe.utils.sbool(include_children):
+			# Get related documents
+			related_docs = frappe.db.sql("""
+				SELECT related_document_id, relationship_type, notes
+				FROM `tabArchive Related Document`
+				WHERE parent = %s AND parenttype = 'Archive Document' AND parentfield = 'related_documents'
+				ORDER BY idx
+			""", (document_id,), as_dict=True)
+			
+			# Get version history
+			versions = frappe.db.sql("""
+				SELECT version_number, version_date, version_notes, file_size, created_by, is_current_version
+				FROM `tabArchive Document Version`
+				WHERE parent = %s AND parenttype = 'Archive Document' AND parentfield = 'version_info'
+				ORDER BY idx
+			""", (document_id,), as_dict=True)
 		
 		# Get audit trail
-		audit_trail = frappe.get_all("Archive Audit Trail",
-			filters={"document_id": document_id},
-			fields=["action", "timestamp", "user", "details", "severity"],
-			order_by="timestamp desc",
-			limit=10
-		)
+		audit_trail = frappe.db.sql("""
+			SELECT action, timestamp, user, details, severity
+			FROM `tabArchive Audit Trail`
+			WHERE document_id = %s
+			ORDER BY timestamp DESC
+			LIMIT 10
+		""", (document_id,), as_dict=True)
 		
 		return {
 			"status": "success",
-			"document": {
-				"name": document.name,
-				"document_id": document.document_id,
-				"document_title": document.document_title,
-				"document_type": document.document_type,
-				"category": document.category,
-				"subcategory": document.subcategory,
-				"description": document.description,
-				"status": document.status,
-				"priority": document.priority,
-				"access_level": document.access_level,
-				"file_attachment": document.file_attachment,
-				"ocr_text": document.ocr_text,
-				"tags": document.tags,
-				"retention_period": document.retention_period,
-				"encryption_status": document.encryption_status,
-				"compliance_status": document.compliance_status,
-				"created_by": document.created_by,
-				"created_on": document.created_on,
-				"last_modified_by": document.last_modified_by,
-				"last_modified_on": document.last_modified_on
-			},
+			"document": document[0],
 			"related_documents": related_docs,
 			"versions": versions,
 			"audit_trail": audit_trail
@@ -217,18 +358,49 @@ def get_document_details(document_id):
 		frappe.log_error(f"Error getting document details: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+# Lifetime of the presigned URLs returned for S3 storage
+S3_DOWNLOAD_URL_EXPIRY = 300
+
+def get_file_download_info(file_url):
+	"""Build the download URL, name, size and content type of a stored file"""
+	file_name = os.path.basename(file_url)
+	file_info = {
+		"file_url": file_url,
+		"file_name": file_name,
+		"file_size": None,
+		"content_type": mimetypes.guess_type(file_name)[0]
+	}
+	
+	# Let the client fetch the bytes straight from S3
+	storage_settings = ArchiveConfig.get_storage_settings()
+	if storage_settings["storage_backend"] == "s3" and storage_settings["aws_s3_bucket"]:
+		import boto3
+		
+		s3_client = boto3.client("s3", region_name=storage_settings["aws_region"])
+		file_info["file_url"] = s3_client.generate_presigned_url("get_object",
+			Params={"Bucket": storage_settings["aws_s3_bucket"], "Key": file_url.lstrip("/")},
+			ExpiresIn=S3_DOWNLOAD_URL_EXPIRY
+		)
+		return file_info
+	
+	folder = "private" if file_url.startswith("/private/") else "public"
+	file_path = frappe.get_site_path(folder, "files", file_name)
+	if not os.path.exists(file_path):
+		return None
+	
+	file_info["file_size"] = os.path.getsize(file_path)
+	return file_info
+
 @frappe.whitelist(allow_guest=False)
 def download_document(document_id, version_number=None):
 	"""Download a document file"""
 	try:
-		document = frappe.get_doc("Archive Document", document_id)
-		
 		# Check access permissions
-		if not frappe.has_permission("Archive Document", "read", document.name):
+		if not frappe.has_permission("Archive Document", "read", document_id):
 			return {"status": "error", "message": "Access denied"}
 		
 		# Get file URL
-		file_url = document.file_attachment
+		file_url = frappe.db.get_value("Archive Document", document_id, "file_attachment")
 		
 		# If specific version requested
 		if version_number:
@@ -243,20 +415,16 @@ def download_document(document_id, version_number=None):
 		if not file_url:
 			return {"status": "error", "message": "File not found"}
 		
-		# Get file document
-		file_doc = frappe.get_doc("File", {"file_url": file_url})
+		# Describe the file from its URL, the File document is not needed
+		file_info = get_file_download_info(file_url)
+		if not file_info:
+			return {"status": "error", "message": "File not found"}
 		
-		# Create audit log
-		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import create_audit_entry
-		create_audit_entry("Document Downloaded", document_id, version_number=version_number)
+		# Create audit log in the background
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import enqueue_audit_entry
+		enqueue_audit_entry("Document Downloaded", document_id=document_id, version_number=version_number)
 		
-		return {
-			"status": "success",
-			"file_url": file_doc.file_url,
-			"file_name": file_doc.file_name,
-			"file_size": file_doc.file_size,
-			"content_type": file_doc.content_type
-		}
+		return {"status": "success", **file_info}
 		
 	except Exception as e:
 		frappe.log_error(f"Error downloading document: {str(e)}")
@@ -271,21 +439,21 @@ def create_document_version(document_id, file_data, version_notes="", change_sum
 			return {"status": "error", "message": "Document not found"}
 		
 		# Decode file data
-		file_content = base64.b64decode(file_data)
+		file_content, file_hash = decode_file_data(file_data)
 		
-		# Create file document
+		# Create file document from the already decoded bytes
 		file_doc = frappe.get_doc({
 			"doctype": "File",
 			"file_name": f"version_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-			"file_size": len(file_content),
-			"content": file_data,
+			"content": file_content,
+			"decode": False,
 			"is_private": 1
 		})
 		file_doc.insert(ignore_permissions=True)
 		
 		# Create version
 		from erpnext_archive_system.erpnext_archive_system.doctype.archive_document_version.archive_document_version import create_new_version
-		result = create_new_version(document_id, file_doc.file_url, version_notes, change_summary)
+		result = create_new_version(document_id, file_doc.file_url, version_notes, change_summary, file_hash)
 		
 		return result
 		
@@ -297,11 +465,11 @@ def create_document_version(document_id, file_data, version_notes="", change_sum
 def get_categories():
 	"""Get all active categories"""
 	try:
-		categories = frappe.get_all("Archive Category",
+		categories = get_cached_value(ARCHIVE_CATEGORIES_CACHE_KEY, lambda: frappe.get_all("Archive Category",
 			filters={"is_active": 1},
 			fields=["name", "category_name", "description", "color", "icon"],
 			order_by="category_name"
-		)
+		))
 		
 		return {"status": "success", "categories": categories}
 		
@@ -313,11 +481,11 @@ def get_categories():
 def get_document_types():
 	"""Get all active document types"""
 	try:
-		document_types = frappe.get_all("Archive Document Type",
+		document_types = get_cached_value(ARCHIVE_DOCUMENT_TYPES_CACHE_KEY, lambda: frappe.get_all("Archive Document Type",
 			filters={"is_active": 1},
 			fields=["name", "document_type_name", "document_type_code", "description", "icon"],
 			order_by="document_type_name"
-		)
+		))
 		
 		return {"status": "success", "document_types": document_types}
 		
@@ -329,108 +497,145 @@ def get_document_types():
 def get_archive_statistics():
 	"""Get archive system statistics"""
 	try:
-		stats = frappe.db.sql("""
-			SELECT 
-				COUNT(*) as total_documents,
-				SUM(CASE WHEN status = 'Active' THEN 1 ELSE 0 END) as active_documents,
-				SUM(CASE WHEN access_level = 'Confidential' THEN 1 ELSE 0 END) as confidential_documents,
-				SUM(CASE WHEN encryption_status = 'Encrypted' THEN 1 ELSE 0 END) as encrypted_documents
-			FROM `tabArchive Document`
-		""", as_dict=True)[0]
-		
-		category_stats = frappe.db.sql("""
-			SELECT 
-				c.category_name,
-				COUNT(d.name) as document_count
-			FROM `tabArchive Category` c
-			LEFT JOIN `tabArchive Document` d ON c.name = d.category
-			WHERE c.is_active = 1
-			GROUP BY c.name, c.category_name
-			ORDER BY document_count DESC
-			LIMIT 10
-		""", as_dict=True)
-		
-		return {
-			"status": "success",
-			"statistics": stats,
-			"category_stats": category_stats
-		}
+		return get_cached_value(ARCHIVE_STATISTICS_CACHE_KEY, compute_archive_statistics)
 		
 	except Exception as e:
 		frappe.log_error(f"Error getting archive statistics: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def compute_archive_statistics():
+	"""Aggregate document counts for the dashboard"""
+	# One pass over the (category, status, access_level, encryption_status) index
+	rows = frappe.db.sql("""
+		SELECT 
+			d.category,
+			COUNT(*) as document_count,
+			SUM(CASE WHEN d.status = 'Active' THEN 1 ELSE 0 END) as active_documents,
+			SUM(CASE WHEN d.access_level = 'Confidential' THEN 1 ELSE 0 END) as confidential_documents,
+			SUM(CASE WHEN d.encryption_status = 'Encrypted' THEN 1 ELSE 0 END) as encrypted_documents
+		FROM `tabArchive Document` d
+		GROUP BY d.category
+	""", as_dict=True)
+	
+	stats = {
+		"total_documents": sum(row.document_count for row in rows),
+		"active_documents": sum(row.active_documents for row in rows),
+		"confidential_documents": sum(row.confidential_documents for row in rows),
+		"encrypted_documents": sum(row.encrypted_documents for row in rows)
+	}
+	
+	# Every active category is listed, including those without documents
+	document_counts = {row.category: row.document_count for row in rows}
+	category_stats = sorted(
+		({"category_name": category.category_name, "document_count": document_counts.get(category.name, 0)}
+		 for category in frappe.get_all("Archive Category", filters={"is_active": 1}, fields=["name", "category_name"])),
+		key=lambda row: row["document_count"],
+		reverse=True
+	)[:10]
+	
+	return {
+		"status": "success",
+		"statistics": stats,
+		"category_stats": category_stats
+	}
+
 @frappe.whitelist(allow_guest=False)
 def bulk_upload_documents(documents_data):
 	"""Bulk upload multiple documents"""
 	try:
 		if isinstance(documents_data, str):
-			documents_data = json.loads(documents_data)
+			documents_data = _loads(documents_data)
 		
-		results = {
-			"total": len(documents_data),
-			"success": 0,
-			"failed": 0,
-			"errors": []
-		}
+		performance_settings = ArchiveConfig.get_performance_settings()
 		
-		for doc_data in documents_data:
-			try:
-				result = upload_document(**doc_data)
-				if result["status"] == "success":
-					results["success"] += 1
-				else:
-					results["failed"] += 1
-					results["errors"].append({
-						"document": doc_data.get("document_title", "Unknown"),
-						"error": result["message"]
-					})
-			except Exception as e:
-				results["failed"] += 1
-				results["errors"].append({
-					"document": doc_data.get("document_title", "Unknown"),
-					"error": str(e)
-				})
+		if not performance_settings["async_processing"] or len(documents_data) < 2:
+			return {"status": "success", "results": upload_documents_batch(documents_data)}
+		
+		# Spread the uploads over at most max_concurrent_uploads background jobs
+		max_jobs = max(cint(performance_settings["max_concurrent_uploads"]), 1)
+		batch_size = -(-len(documents_data) // max_jobs)
 		
-		return {"status": "success", "results": results}
+		job_ids = []
+		for start in range(0, len(documents_data), batch_size):
+			job = frappe.enqueue(upload_documents_batch,
+				queue="long",
+				documents_data=documents_data[start:start + batch_size]
+			)
+			job_ids.append(job.id)
+		
+		return {"status": "queued", "total": len(documents_data), "job_ids": job_ids}
 		
 	except Exception as e:
 		frappe.log_error(f"Error in bulk upload: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def upload_documents_batch(documents_data):
+	"""Upload a batch of documents and collect the per document results"""
+	results = {
+		"total": len(documents_data),
+		"success": 0,
+		"failed": 0,
+		"errors": []
+	}
+	
+	for doc_data in documents_data:
+		try:
+			result = upload_document(**doc_data)
+			if result["status"] == "success":
+				results["success"] += 1
+			else:
+				results["failed"] += 1
+				results["errors"].append({
+					"document": doc_data.get("document_title", "Unknown"),
+					"error": result["message"]
+				})
+		except Exception as e:
+			results["failed"] += 1
+			results["errors"].append({
+				"document": doc_data.get("document_title", "Unknown"),
+				"error": str(e)
+			})
+	
+	if results["failed"]:
+		frappe.log_error(f"Bulk upload batch failed for {results['failed']} documents: {json.dumps(results['errors'])}")
+	
+	return results
+
+# Columns written by export_documents, in output order
+EXPORT_FIELDS = ["document_id", "document_title", "category", "status", "created_on", "description", "tags"]
+
 @frappe.whitelist(allow_guest=False)
 def export_documents(document_ids, format="json"):
 	"""Export documents in specified format"""
 	try:
 		if isinstance(document_ids, str):
-			document_ids = json.loads(document_ids)
-		
-		documents = []
-		for doc_id in document_ids:
-			doc = frappe.get_doc("Archive Document", doc_id)
-			documents.append({
-				"document_id": doc.document_id,
-				"document_title": doc.document_title,
-				"category": doc.category,
-				"status": doc.status,
-				"created_on": doc.created_on,
-				"description": doc.description,
-				"tags": doc.tags
-			})
+			document_ids = _loads(document_ids)
+		
+		rows = frappe.get_all("Archive Document",
+			filters={"name": ["in", document_ids]},
+			fields=["name", *EXPORT_FIELDS]
+		)
+		
+		# Keep the order in which the documents were requested
+		rows_by_name = {row.pop("name"): row for row in rows}
+		documents = [rows_by_name[doc_id] for doc_id in document_ids if doc_id in rows_by_name]
 		
 		if format == "json":
 			return {"status": "success", "data": documents}
 		elif format == "csv":
-			# Convert to CSV format
+			# Send the CSV as a file download instead of a string inside the JSON response
 			import csv
 			import io
 			
 			output = io.StringIO()
-			writer = csv.DictWriter(output, fieldnames=documents[0].keys() if documents else [])
-			writer.writeheader()
-			writer.writerows(documents)
+			writer = csv.writer(output)
+			writer.writerow(EXPORT_FIELDS)
+			writer.writerows([doc[field] for field in EXPORT_FIELDS] for doc in documents)
 			
-			return {"status": "success", "data": output.getvalue()}
+			frappe.response.filename = "archive_export.csv"
+			frappe.response.filecontent = output.getvalue()
+			frappe.response.type = "download"
+			return
 		else:
 			return {"status": "error", "message": "Unsupported format"}
 		
@@ -1,10 +1,65 @@
 import frappe
 from frappe import _
+import copy
+import functools
+import os
+
+# Parse JSON arguments with orjson when it is installed
+try:
+	from orjson import loads as _loads
+except ImportError:
+	from json import loads as _loads
+
+# Settings getters memoized per site, see site_cached
+SITE_CACHED_GETTERS = []
+
+def get_site_config_version():
+	"""Identify the current site and common config files by their modification times"""
+	versions = []
+	for path in (frappe.get_site_path("site_config.json"), os.path.join(frappe.local.sites_path, "common_site_config.json")):
+		try:
+			versions.append(os.stat(path).st_mtime_ns)
+		except OSError:
+			versions.append(None)
+	
+	return tuple(versions)
+
+def site_cached(func):
+	"""Cache a settings getter per site until its config files change, in every worker process"""
+	# bench set-config rewrites the config file, so its mtime is the version shared by all workers
+	cached = functools.lru_cache(maxsize=64)(lambda site, config_version: func())
+	
+	@functools.wraps(func)
+	def wrapper():
+		# Callers get their own copy and cannot change the cached settings
+		return copy.deepcopy(cached(frappe.local.site, get_site_config_version()))
+	
+	wrapper.cache_clear = cached.cache_clear
+	SITE_CACHED_GETTERS.append(wrapper)
+	return wrapper
+
+@functools.lru_cache(maxsize=None)
+def has_sha_extensions():
+	"""Check whether OpenSSL can use the CPU's SHA-256 instructions, assumed True when it cannot be told"""
+	try:
+		with open("/proc/cpuinfo") as f:
+			flags = next((line.split(":", 1)[1].split() for line in f if line.startswith(("flags", "Features"))), None)
+	except OSError:
+		return True
+	
+	# x86 reports sha_ni in flags, ARM reports sha2 in Features
+	return flags is None or "sha_ni" in flags or "sha2" in flags
+
+def clear_settings_cache():
+	"""Drop all memoized settings so the next call reads the site config again"""
+	for getter in SITE_CACHED_GETTERS:
+		getter.cache_clear()
 
 class ArchiveConfig:
 	"""Configuration class for the Archive System"""
 	
 	@staticmethod
+	@site_cached
 	def get_ocr_settings():
 		"""Get OCR configuration settings"""
 		return {
@@ -16,6 +71,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_encryption_settings():
 		"""Get encryption configuration settings"""
 		return {
@@ -26,6 +82,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_storage_settings():
 		"""Get storage configuration settings"""
 		return {
@@ -38,6 +95,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_search_settings():
 		"""Get search configuration settings"""
 		return {
@@ -49,6 +107,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_retention_settings():
 		"""Get retention policy settings"""
 		return {
@@ -59,6 +118,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_compliance_settings():
 		"""Get compliance and audit settings"""
 		return {
@@ -70,6 +130,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_performance_settings():
 		"""Get performance optimization settings"""
 		return {
@@ -77,10 +138,11 @@ class ArchiveConfig:
 			"cache_ttl_seconds": frappe.get_conf().get("archive_cache_ttl", 3600),
 			"max_concurrent_uploads": frappe.get_conf().get("archive_max_concurrent_uploads", 5),
 			"thumbnail_generation": frappe.get_conf().get("archive_thumbnail_generation", True),
-			"async_processing": frappe.get_conf().get("archive_async_processing", True)
+			"async_processing": frappe.get_conf().get("archive_async_processing", False)
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_integration_settings():
 		"""Get integration settings"""
 		return {
@@ -92,6 +154,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_ui_settings():
 		"""Get UI and user experience settings"""
 		return {
@@ -123,6 +186,10 @@ class ArchiveConfig:
 		if storage_settings["storage_backend"] == "s3" and not storage_settings["aws_s3_bucket"]:
 			errors.append("S3 storage backend selected but S3 bucket not configured.")
 		
+		# Check hashing speed of version files
+		if not has_sha_extensions():
+			warnings.append("CPU does not report SHA extensions (sha_ni). File hashing will use the slower software SHA-256.")
+		
 		# Check search settings
 		search_settings = ArchiveConfig.get_search_settings()
 		if search_settings["search_backend"] == "elasticsearch" and not search_settings["elasticsearch_url"]:
@@ -135,6 +202,7 @@ class ArchiveConfig:
 		}
 	
 	@staticmethod
+	@site_cached
 	def get_default_settings():
 		"""Get default configuration settings"""
 		return {
@@ -169,10 +237,8 @@ def get_archive_config():
 def update_archive_config(config_data):
 	"""Update archive system configuration"""
 	try:
-		import json
-		
 		if isinstance(config_data, str):
-			config_data = json.loads(config_data)
+			config_data = _loads(config_data)
 		
 		# Update configuration values
 		for section, settings in config_data.items():
@@ -180,6 +246,7 @@ def update_archive_config(config_data):
 				config_key = f"archive_{section}_{key}"
 				frappe.conf[config_key] = value
 		
+		clear_settings_cache()
 		frappe.db.commit()
 		
 		return {"status": "success", "message": "Configuration updated successfully"}
@@ -1,8 +1,64 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.utils import cint
 import json
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+
+# Days an audit entry is kept, by action
+RETENTION_DAYS = {
+	"Document Created": 2555,  # 7 years
+	"Document Updated": 2555,
+	"Document Deleted": 2555,
+	"Document Accessed": 365,   # 1 year
+	"Document Downloaded": 2555,
+	"Document Shared": 2555,
+	"Version Created": 2555,
+	"Version Restored": 2555,
+	"Category Created": 2555,
+	"Category Updated": 2555,
+	"Category Deleted": 2555,
+	"Access Granted": 2555,
+	"Access Revoked": 2555,
+	"Encryption Applied": 2555,
+	"Decryption Applied": 2555,
+	"OCR Processed": 2555,
+	"Auto Categorized": 2555,
+	"Compliance Check": 2555,
+	"Audit Report Generated": 2555,
+	"System Error": 2555,
+	"Security Violation": 2555
+}
+
+# Retention of actions missing from RETENTION_DAYS
+DEFAULT_RETENTION = timedelta(days=2555)  # 7 years
+
+# Retention periods built once, so saving an entry allocates no timedelta
+RETENTION_PERIODS = {action: timedelta(days=days) for action, days in RETENTION_DAYS.items()}
+
+# Actions flagged for compliance reporting
+COMPLIANCE_ACTIONS = frozenset((
+	"Document Created",
+	"Document Updated", 
+	"Document Deleted",
+	"Document Downloaded",
+	"Document Shared",
+	"Access Granted",
+	"Access Revoked",
+	"Encryption Applied",
+	"Decryption Applied",
+	"Compliance Check",
+	"Security Violation"
+))
+
+# Archive Audit Trail columns written by insert_audit_entries
+AUDIT_TRAIL_FIELDS = (
+	"name", "creation", "modified", "owner", "modified_by",
+	"parent", "parentfield", "parenttype",
+	"action", "timestamp", "document_id", "category_id", "version_number", "user",
+	"ip_address", "user_agent", "session_id", "details", "severity", "status",
+	"compliance_flag", "retention_until"
+)
 
 class ArchiveAuditTrail(Document):
 	def validate(self):
@@ -17,20 +73,21 @@ class ArchiveAuditTrail(Document):
 	
 	def set_default_values(self):
 		"""Set default values"""
+		session = frappe.session
+		
 		if not self.timestamp:
 			self.timestamp = frappe.utils.now()
 		
 		if not self.user:
-			self.user = frappe.session.user
-		
-		if not self.ip_address and frappe.local.request:
-			self.ip_address = frappe.local.request.environ.get('REMOTE_ADDR', 'Unknown')
+			self.user = session.user
 		
-		if not self.user_agent and frappe.local.request:
-			self.user_agent = frappe.local.request.environ.get('HTTP_USER_AGENT', 'Unknown')
+		if frappe.local.request and not (self.ip_address and self.user_agent):
+			ip_address, user_agent = get_request_meta('Unknown')
+			self.ip_address = self.ip_address or ip_address
+			self.user_agent = self.user_agent or user_agent
 		
 		if not self.session_id:
-			self.session_id = frappe.session.sid if frappe.session.sid else 'Unknown'
+			self.session_id = session.sid if session.sid else 'Unknown'
 	
 	def validate_required_fields(self):
 		"""Validate required fields"""
@@ -42,50 +99,11 @@ class ArchiveAuditTrail(Document):
 	
 	def set_retention_date(self):
 		"""Set retention date based on action type"""
-		retention_days = {
-			"Document Created": 2555,  # 7 years
-			"Document Updated": 2555,
-			"Document Deleted": 2555,
-			"Document Accessed": 365,   # 1 year
-			"Document Downloaded": 2555,
-			"Document Shared": 2555,
-			"Version Created": 2555,
-			"Version Restored": 2555,
-			"Category Created": 2555,
-			"Category Updated": 2555,
-			"Category Deleted": 2555,
-			"Access Granted": 2555,
-			"Access Revoked": 2555,
-			"Encryption Applied": 2555,
-			"Decryption Applied": 2555,
-			"OCR Processed": 2555,
-			"Auto Categorized": 2555,
-			"Compliance Check": 2555,
-			"Audit Report Generated": 2555,
-			"System Error": 2555,
-			"Security Violation": 2555
-		}
-		
-		days = retention_days.get(self.action, 2555)  # Default 7 years
-		self.retention_until = (datetime.now() + timedelta(days=days)).date()
+		self.retention_until = get_retention_until(self.action)
 	
 	def set_compliance_flag(self):
 		"""Set compliance flag based on action type"""
-		compliance_actions = [
-			"Document Created",
-			"Document Updated", 
-			"Document Deleted",
-			"Document Downloaded",
-			"Document Shared",
-			"Access Granted",
-			"Access Revoked",
-			"Encryption Applied",
-			"Decryption Applied",
-			"Compliance Check",
-			"Security Violation"
-		]
-		
-		self.compliance_flag = self.action in compliance_actions
+		self.compliance_flag = self.action in COMPLIANCE_ACTIONS
 	
 	def get_audit_summary(self):
 		"""Get audit summary for reporting"""
@@ -110,72 +128,168 @@ class ArchiveAuditTrail(Document):
 		
 		return summary
 
+def get_retention_until(action, today=None):
+	"""Get the date until which an audit entry for the action is kept"""
+	return (today or date.today()) + RETENTION_PERIODS.get(action, DEFAULT_RETENTION)
+
+def get_request_meta(default="System"):
+	"""Get the IP address and user agent of the current request, looked up once per request"""
+	request = getattr(frappe.local, "request", None)
+	if not request:
+		return default, default
+	
+	meta = frappe.flags.archive_request_meta
+	if meta is None:
+		# Frappe resolves request_ip once per request, honouring X-Forwarded-For
+		environ = request.environ
+		meta = frappe.flags.archive_request_meta = (
+			getattr(frappe.local, "request_ip", None) or environ.get('REMOTE_ADDR'),
+			environ.get('HTTP_USER_AGENT')
+		)
+	
+	return meta[0] or default, meta[1] or default
+
+def build_audit_entry(action, document_id=None, category_id=None, version_number=None, 
+					 details="", severity="Low", status="Success", timestamp=None):
+	"""Build an audit trail entry for the current user and request"""
+	session = frappe.session
+	ip_address, user_agent = get_request_meta()
+	
+	return {
+		"doctype": "Archive Audit Trail",
+		"name": frappe.generate_hash(length=10),
+		"action": action,
+		"document_id": document_id,
+		"category_id": category_id,
+		"version_number": version_number,
+		"details": details,
+		"severity": severity,
+		"status": status,
+		"user": session.user,
+		"timestamp": timestamp or frappe.utils.now(),
+		"ip_address": ip_address,
+		"user_agent": user_agent,
+		"session_id": session.sid if session.sid else "System"
+	}
+
 @frappe.whitelist()
 def create_audit_entry(action, document_id=None, category_id=None, version_number=None, 
 					  details="", severity="Low", status="Success"):
 	"""Create audit trail entry"""
 	try:
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": action,
-			"document_id": document_id,
-			"category_id": category_id,
-			"version_number": version_number,
-			"details": details,
-			"severity": severity,
-			"status": status,
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"user_agent": frappe.local.request.environ.get('HTTP_USER_AGENT') if frappe.local.request else "System",
-			"session_id": frappe.session.sid if frappe.session.sid else "System"
-		}
+		audit_entry = build_audit_entry(action, document_id, category_id, version_number,
+			details, severity, status)
+		queue_audit_entry(audit_entry)
 		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
-		
-		return {"status": "success", "audit_id": audit_doc.name}
+		return {"status": "success", "audit_id": audit_entry["name"]}
 		
 	except Exception as e:
 		frappe.log_error(f"Error creating audit entry: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def queue_audit_entry(audit_entry):
+	"""Buffer an audit trail entry until the current transaction commits"""
+	if not frappe.flags.archive_audit_entries:
+		frappe.flags.archive_audit_entries = []
+		frappe.db.before_commit.add(flush_audit_entries)
+		frappe.db.after_rollback.add(discard_audit_entries)
+	
+	frappe.flags.archive_audit_entries.append(audit_entry)
+
+def flush_audit_entries():
+	"""Write the buffered audit trail entries"""
+	audit_entries = frappe.flags.archive_audit_entries
+	frappe.flags.archive_audit_entries = None
+	insert_audit_entries(audit_entries)
+
+def discard_audit_entries():
+	"""Drop the buffered audit trail entries of a rolled back transaction"""
+	frappe.flags.archive_audit_entries = None
+
+def get_audit_entry_count():
+	"""Return how many audit trail entries are buffered, to mark a savepoint"""
+	return len(frappe.flags.archive_audit_entries or [])
+
+def discard_audit_entries_since(count):
+	"""Drop the entries buffered after get_audit_entry_count returned count, when rolling back to a savepoint"""
+	if frappe.flags.archive_audit_entries:
+		del frappe.flags.archive_audit_entries[count:]
+
+def enqueue_audit_entry(action, **kwargs):
+	"""Create audit trail entry from a background job, for read-only requests that never commit"""
+	# Changes to documents use queue_audit_entry, which is written or dropped with their transaction
+	# The request details are captured now, the job itself runs without a request
+	frappe.enqueue(insert_audit_entry, queue="short", audit_entry=build_audit_entry(action, **kwargs))
+
+def insert_audit_entry(audit_entry):
+	"""Insert a prepared audit trail entry"""
+	insert_audit_entries([audit_entry])
+
+def insert_audit_entries(audit_entries):
+	"""Insert prepared audit trail entries with a single multi-row INSERT"""
+	if not audit_entries:
+		return
+	
+	# Values that validate and before_save would set are computed here instead
+	values = []
+	today = date.today()
+	for entry in audit_entries:
+		timestamp = entry.get("timestamp") or frappe.utils.now()
+		user = entry.get("user") or frappe.session.user
+		action = entry["action"]
+		
+		values.append((
+			entry.get("name") or frappe.generate_hash(length=10),
+			timestamp,
+			timestamp,
+			user,
+			user,
+			entry.get("parent"),
+			entry.get("parentfield"),
+			entry.get("parenttype"),
+			action,
+			timestamp,
+			entry.get("document_id"),
+			entry.get("category_id"),
+			entry.get("version_number"),
+			user,
+			entry.get("ip_address"),
+			entry.get("user_agent"),
+			entry.get("session_id"),
+			entry.get("details"),
+			entry.get("severity") or "Low",
+			entry.get("status") or "Success",
+			1 if action in COMPLIANCE_ACTIONS else 0,
+			get_retention_until(action, today)
+		))
+	
+	frappe.db.bulk_insert("Archive Audit Trail", AUDIT_TRAIL_FIELDS, values)
+
 @frappe.whitelist()
 def get_audit_trail(document_id=None, category_id=None, user=None, 
-				   start_date=None, end_date=None, action=None, limit=100):
-	"""Get audit trail entries with filters"""
+				   start_date=None, end_date=None, action=None, limit=100,
+				   cursor_timestamp=None, cursor_name=None):
+	"""Get audit trail entries with filters, continuing after the given cursor entry"""
 	try:
-		filters = {}
-		
-		if document_id:
-			filters["document_id"] = document_id
-		
-		if category_id:
-			filters["category_id"] = category_id
-		
-		if user:
-			filters["user"] = user
-		
-		if action:
-			filters["action"] = action
+		conditions, params = build_date_conditions(start_date, end_date)
 		
-		if start_date:
-			filters["timestamp"] = [">=", start_date]
+		for field, value in (("document_id", document_id), ("category_id", category_id),
+			("user", user), ("action", action)):
+			if value:
+				conditions += f" AND {field} = %s"
+				params.append(value)
 		
-		if end_date:
-			if "timestamp" in filters:
-				filters["timestamp"] = [filters["timestamp"][0], filters["timestamp"][1], "<=", end_date]
-			else:
-				filters["timestamp"] = ["<=", end_date]
+		cursor_conditions, cursor_params = build_cursor_conditions(cursor_timestamp, cursor_name)
 		
-		audit_entries = frappe.get_all("Archive Audit Trail",
-			filters=filters,
-			fields=["name", "action", "timestamp", "user", "document_id", 
-				   "category_id", "version_number", "severity", "status", 
-				   "details", "compliance_flag"],
-			order_by="timestamp desc",
-			limit=limit
-		)
+		audit_entries = frappe.db.sql(f"""
+			SELECT name, action, timestamp, user, document_id, 
+				category_id, version_number, severity, status, 
+				details, compliance_flag
+			FROM `tabArchive Audit Trail`
+			WHERE 1=1 {conditions} {cursor_conditions}
+			ORDER BY timestamp DESC, name DESC
+			LIMIT %s
+		""", params + cursor_params + [cint(limit)], as_dict=True)
 		
 		return audit_entries
 		
@@ -183,130 +297,167 @@ def get_audit_trail(document_id=None, category_id=None, user=None,
 		frappe.log_error(f"Error getting audit trail: {str(e)}")
 		return []
 
+def build_cursor_conditions(cursor_timestamp=None, cursor_name=None):
+	"""Build the keyset conditions selecting entries after the last one of the previous page"""
+	if not (cursor_timestamp and cursor_name):
+		return "", []
+	
+	return " AND (timestamp < %s OR (timestamp = %s AND name < %s))", [cursor_timestamp, cursor_timestamp, cursor_name]
+
+def build_date_conditions(start_date=None, end_date=None):
+	"""Build the parameterized timestamp condition of a date range"""
+	if start_date and end_date:
+		return " AND timestamp BETWEEN %s AND %s", [start_date, end_date]
+	
+	if start_date:
+		return " AND timestamp >= %s", [start_date]
+	
+	if end_date:
+		return " AND timestamp <= %s", [end_date]
+	
+	return "", []
+
 @frappe.whitelist()
 def get_audit_statistics(start_date=None, end_date=None):
 	"""Get audit statistics"""
 	try:
-		date_filter = {}
-		if start_date:
-			date_filter["timestamp"] = [">=", start_date]
-		if end_date:
-			if "timestamp" in date_filter:
-				date_filter["timestamp"] = [date_filter["timestamp"][0], date_filter["timestamp"][1], "<=", end_date]
-			else:
-				date_filter["timestamp"] = ["<=", end_date]
-		
-		# Get action counts
-		action_counts = frappe.db.sql("""
-			SELECT action, COUNT(*) as count
+		conditions, params = build_date_conditions(start_date, end_date)
+		
+		# Action counts and compliance statistics come from one grouped scan
+		groups = frappe.db.sql(f"""
+			SELECT action, compliance_flag, severity, status, COUNT(*) as count
 			FROM `tabArchive Audit Trail`
-			WHERE 1=1
-			{filters}
-			GROUP BY action
-			ORDER BY count DESC
-		""".format(filters=" AND ".join([f"{k} {v[0]} '{v[1]}'" for k, v in date_filter.items()])), as_dict=True)
+			WHERE 1=1 {conditions}
+			GROUP BY action, compliance_flag, severity, status
+		""", params, as_dict=True)
+		
+		counts_by_action = {}
+		compliance_stats = {"compliance_actions": 0, "total_actions": 0, "critical_actions": 0, "failed_actions": 0}
+		for group in groups:
+			counts_by_action[group.action] = counts_by_action.get(group.action, 0) + group.count
+			compliance_stats["total_actions"] += group.count
+			if group.compliance_flag:
+				compliance_stats["compliance_actions"] += group.count
+			if group.severity == "Critical":
+				compliance_stats["critical_actions"] += group.count
+			if group.status == "Failed":
+				compliance_stats["failed_actions"] += group.count
+		
+		action_counts = [frappe._dict(action=action, count=count)
+			for action, count in sorted(counts_by_action.items(), key=lambda item: item[1], reverse=True)]
 		
 		# Get user activity
-		user_activity = frappe.db.sql("""
+		user_activity = frappe.db.sql(f"""
 			SELECT user, COUNT(*) as count
 			FROM `tabArchive Audit Trail`
-			WHERE 1=1
-			{filters}
+			WHERE 1=1 {conditions}
 			GROUP BY user
 			ORDER BY count DESC
 			LIMIT 10
-		""".format(filters=" AND ".join([f"{k} {v[0]} '{v[1]}'" for k, v in date_filter.items()])), as_dict=True)
-		
-		# Get compliance statistics
-		compliance_stats = frappe.db.sql("""
-			SELECT 
-				SUM(CASE WHEN compliance_flag = 1 THEN 1 ELSE 0 END) as compliance_actions,
-				COUNT(*) as total_actions,
-				SUM(CASE WHEN severity = 'Critical' THEN 1 ELSE 0 END) as critical_actions,
-				SUM(CASE WHEN status = 'Failed' THEN 1 ELSE 0 END) as failed_actions
-			FROM `tabArchive Audit Trail`
-			WHERE 1=1
-			{filters}
-		""".format(filters=" AND ".join([f"{k} {v[0]} '{v[1]}'" for k, v in date_filter.items()])), as_dict=True)
+		""", params, as_dict=True)
 		
 		return {
 			"action_counts": action_counts,
 			"user_activity": user_activity,
-			"compliance_stats": compliance_stats[0] if compliance_stats else {}
+			"compliance_stats": compliance_stats
 		}
 		
 	except Exception as e:
 		frappe.log_error(f"Error getting audit statistics: {str(e)}")
 		return {}
 
+# Detailed actions returned per compliance report page, by default and at most
+COMPLIANCE_REPORT_PAGE_SIZE = 500
+COMPLIANCE_REPORT_MAX_PAGE_SIZE = 5000
+
+# Most recent critical actions included in a compliance report
+COMPLIANCE_REPORT_CRITICAL_LIMIT = 500
+
 @frappe.whitelist()
-def generate_compliance_report(start_date=None, end_date=None):
+def generate_compliance_report(start_date=None, end_date=None, limit=COMPLIANCE_REPORT_PAGE_SIZE,
+							   cursor_timestamp=None, cursor_name=None):
 	"""Generate compliance report"""
 	try:
-		date_filter = {}
-		if start_date:
-			date_filter["timestamp"] = [">=", start_date]
-		if end_date:
-			if "timestamp" in date_filter:
-				date_filter["timestamp"] = [date_filter["timestamp"][0], date_filter["timestamp"][1], "<=", end_date]
-			else:
-				date_filter["timestamp"] = ["<=", end_date]
-		
-		# Get compliance-related actions
-		compliance_actions = frappe.get_all("Archive Audit Trail",
-			filters={**date_filter, "compliance_flag": 1},
-			fields=["action", "timestamp", "user", "document_id", "details", "severity"],
-			order_by="timestamp desc"
-		)
+		conditions, params = build_date_conditions(start_date, end_date)
+		conditions = " AND compliance_flag = 1" + conditions
+		limit = min(cint(limit) or COMPLIANCE_REPORT_PAGE_SIZE, COMPLIANCE_REPORT_MAX_PAGE_SIZE)
 		
-		# Generate report summary
-		report = {
+		# Counts are grouped by the database instead of looping over every action
+		actions_by_type = frappe.db.sql(f"""
+			SELECT action, COUNT(*)
+			FROM `tabArchive Audit Trail`
+			WHERE 1=1 {conditions}
+			GROUP BY action
+		""", params)
+		
+		actions_by_user = frappe.db.sql(f"""
+			SELECT user, COUNT(*)
+			FROM `tabArchive Audit Trail`
+			WHERE 1=1 {conditions}
+			GROUP BY user
+		""", params)
+		
+		critical_actions = frappe.db.sql(f"""
+			SELECT name, action, timestamp, user, document_id, details, severity
+			FROM `tabArchive Audit Trail`
+			WHERE severity = 'Critical' {conditions}
+			ORDER BY timestamp DESC, name DESC
+			LIMIT %s
+		""", params + [COMPLIANCE_REPORT_CRITICAL_LIMIT], as_dict=True)
+		
+		# Detailed actions are returned a page at a time
+		cursor_conditions, cursor_params = build_cursor_conditions(cursor_timestamp, cursor_name)
+		detailed_actions = frappe.db.sql(f"""
+			SELECT name, action, timestamp, user, document_id, details, severity
+			FROM `tabArchive Audit Trail`
+			WHERE 1=1 {conditions} {cursor_conditions}
+			ORDER BY timestamp DESC, name DESC
+			LIMIT %s
+		""", params + cursor_params + [limit], as_dict=True)
+		
+		next_cursor = None
+		if len(detailed_actions) == limit:
+			next_cursor = {"timestamp": detailed_actions[-1].timestamp, "name": detailed_actions[-1].name}
+		
+		return {
 			"report_generated": frappe.utils.now(),
 			"period": {
 				"start_date": start_date,
 				"end_date": end_date
 			},
-			"total_compliance_actions": len(compliance_actions),
-			"actions_by_type": {},
-			"actions_by_user": {},
-			"critical_actions": [],
-			"detailed_actions": compliance_actions
+			"total_compliance_actions": sum(count for action, count in actions_by_type),
+			"actions_by_type": dict(actions_by_type),
+			"actions_by_user": dict(actions_by_user),
+			"critical_actions": critical_actions,
+			"detailed_actions": detailed_actions,
+			"next_cursor": next_cursor
 		}
 		
-		# Group by action type
-		for action in compliance_actions:
-			action_type = action.action
-			if action_type not in report["actions_by_type"]:
-				report["actions_by_type"][action_type] = 0
-			report["actions_by_type"][action_type] += 1
-			
-			# Group by user
-			user = action.user
-			if user not in report["actions_by_user"]:
-				report["actions_by_user"][user] = 0
-			report["actions_by_user"][user] += 1
-			
-			# Collect critical actions
-			if action.severity == "Critical":
-				report["critical_actions"].append(action)
-		
-		return report
-		
 	except Exception as e:
 		frappe.log_error(f"Error generating compliance report: {str(e)}")
 		return {"error": "Report generation failed"}
 
+# Audit entries deleted per transaction by cleanup_old_audit_entries
+AUDIT_CLEANUP_BATCH_SIZE = 10000
+
 @frappe.whitelist()
 def cleanup_old_audit_entries():
 	"""Clean up old audit entries based on retention policy"""
 	try:
-		# Delete entries past retention date
-		deleted_count = frappe.db.sql("""
-			DELETE FROM `tabArchive Audit Trail`
-			WHERE retention_until < CURDATE()
-		""")
-		
-		frappe.db.commit()
+		# Delete entries past retention date in bounded batches, each in its own transaction
+		deleted_count = 0
+		while True:
+			frappe.db.sql("""
+				DELETE FROM `tabArchive Audit Trail`
+				WHERE retention_until < CURDATE()
+				LIMIT %s
+			""", (AUDIT_CLEANUP_BATCH_SIZE,))
+			batch_count = frappe.db.sql("SELECT ROW_COUNT()")[0][0]
+			frappe.db.commit()
+			
+			deleted_count += batch_count
+			if batch_count < AUDIT_CLEANUP_BATCH_SIZE:
+				break
 		
 		return {"status": "success", "deleted_count": deleted_count}
 		
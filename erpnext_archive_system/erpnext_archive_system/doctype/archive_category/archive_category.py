@@ -2,6 +2,8 @@ import frappe
 from frappe.model.document import Document
 from frappe import _
 import json
+from collections import defaultdict
+import re
 
 class ArchiveCategory(Document):
 	def validate(self):
@@ -18,15 +20,30 @@ class ArchiveCategory(Document):
 		"""Process after category creation"""
 		self.create_audit_log("Category Created")
 	
+	def on_update(self):
+		"""Process after category save"""
+		self.clear_lookup_cache()
+	
 	def on_trash(self):
 		"""Process before category deletion"""
 		self.validate_category_deletion()
 		self.create_audit_log("Category Deleted")
+		self.clear_lookup_cache()
+	
+	def clear_lookup_cache(self):
+		"""Drop cached category lists and statistics so they include this change"""
+		from erpnext_archive_system.erpnext_archive_system.api.archive_api import (
+			ARCHIVE_CATEGORIES_CACHE_KEY, ARCHIVE_CATEGORY_ACTIVE_CACHE_KEY, ARCHIVE_STATISTICS_CACHE_KEY
+		)
+		frappe.cache().delete_value([ARCHIVE_CATEGORIES_CACHE_KEY, ARCHIVE_STATISTICS_CACHE_KEY])
+		frappe.cache().hdel(ARCHIVE_CATEGORY_ACTIVE_CACHE_KEY, self.name)
 	
 	def validate_category_code(self):
 		"""Ensure category code is unique"""
 		if self.category_code:
-			if frappe.db.exists("Archive Category", {"category_code": self.category_code, "name": ["!=", self.name]}):
+			# A point lookup on the unique category_code index
+			existing = frappe.db.get_value("Archive Category", {"category_code": self.category_code}, "name")
+			if existing and existing != self.name:
 				frappe.throw(_("Category Code {0} already exists").format(self.category_code))
 	
 	def validate_parent_category(self):
@@ -36,8 +53,7 @@ class ArchiveCategory(Document):
 				frappe.throw(_("Category cannot be its own parent"))
 			
 			# Check for circular reference
-			parent = frappe.get_doc("Archive Category", self.parent)
-			if self.is_child_of(parent.name):
+			if self.name in {row.name for row in get_category_ancestors(self.parent)}:
 				frappe.throw(_("Circular reference detected in category hierarchy"))
 	
 	def is_child_of(self, parent_name):
@@ -45,11 +61,7 @@ class ArchiveCategory(Document):
 		if not self.parent:
 			return False
 		
-		if self.parent == parent_name:
-			return True
-		
-		parent = frappe.get_doc("Archive Category", self.parent)
-		return parent.is_child_of(parent_name)
+		return parent_name in {row.name for row in get_category_ancestors(self.parent)}
 	
 	def set_default_values(self):
 		"""Set default values"""
@@ -61,12 +73,16 @@ class ArchiveCategory(Document):
 	
 	def update_modified_info(self):
 		"""Update modification information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
+		now = self.modified or frappe.utils.now()
+		user = frappe.session.user
+		
 		if not self.created_by:
-			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_by = user
+			self.created_on = now
 		
-		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_by = user
+		self.last_modified_on = now
 	
 	def validate_category_deletion(self):
 		"""Validate if category can be deleted"""
@@ -82,18 +98,13 @@ class ArchiveCategory(Document):
 	
 	def create_audit_log(self, action):
 		"""Create audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Category {action}",
-			"category_id": self.name,
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Category '{self.category_name}' {action.lower()}"
-		}
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
 		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		# Written with the transaction, so a blocked delete or failed insert leaves no entry
+		queue_audit_entry(build_audit_entry(f"Category {action}",
+			category_id=self.name,
+			details=f"Category '{self.category_name}' {action.lower()}"
+		))
 	
 	def get_child_categories(self):
 		"""Get all child categories"""
@@ -110,58 +121,104 @@ class ArchiveCategory(Document):
 	
 	def get_category_hierarchy(self):
 		"""Get full category hierarchy"""
-		hierarchy = []
-		current = self
-		
-		while current:
-			hierarchy.insert(0, {
-				"name": current.name,
-				"category_name": current.category_name,
-				"category_code": current.category_code
-			})
-			if current.parent:
-				current = frappe.get_doc("Archive Category", current.parent)
-			else:
-				current = None
+		hierarchy = get_category_ancestors(self.parent)[::-1] if self.parent else []
+		hierarchy.append({
+			"name": self.name,
+			"category_name": self.category_name,
+			"category_code": self.category_code
+		})
 		
 		return hierarchy
 	
 	def apply_auto_categorization(self, document_content, document_title=""):
 		"""Apply auto categorization rules"""
-		if not self.auto_categorization_rules:
+		rules = get_compiled_rules([self.name]).get(self.name)
+		if not rules:
 			return False
 		
-		content_to_check = f"{document_title} {document_content}".lower()
-		
-		for rule in self.auto_categorization_rules:
-			if rule.rule_type == "Keyword":
-				if rule.keyword.lower() in content_to_check:
-					return True
-			elif rule.rule_type == "Pattern":
-				import re
-				if re.search(rule.pattern, content_to_check):
-					return True
-			elif rule.rule_type == "Document Type":
-				# This would need to be implemented based on document type detection
-				pass
-		
-		return False
+		return match_categorization_rules(rules, f"{document_title} {document_content}".lower())
+
+def get_compiled_rules(categories):
+	"""Load the active auto categorization rules of several categories in one query, ready for matching"""
+	rules = frappe.get_all("Archive Category Rule",
+		filters={"category": ["in", categories], "is_active": 1, "rule_type": ["in", ["Keyword", "Pattern"]]},
+		fields=["category", "rule_type", "keyword", "pattern"],
+		order_by="priority asc"
+	)
+	
+	compiled_rules = {}
+	for rule in rules:
+		if rule.rule_type == "Keyword" and rule.keyword:
+			compiled_rules.setdefault(rule.category, []).append((rule.rule_type, rule.keyword.lower()))
+		elif rule.rule_type == "Pattern" and rule.pattern:
+			try:
+				compiled_rules.setdefault(rule.category, []).append((rule.rule_type, re.compile(rule.pattern)))
+			except re.error:
+				continue
+		# Document Type rules would need document type detection
+	
+	return compiled_rules
+
+def match_categorization_rules(rules, content_to_check):
+	"""Check if any of a category's compiled auto categorization rules matches the lowercased content"""
+	for rule_type, matcher in rules:
+		if rule_type == "Keyword":
+			if matcher in content_to_check:
+				return True
+		elif matcher.search(content_to_check):
+			return True
+	
+	return False
+
+# Deepest category hierarchy walked, which also ends the walk on a stored loop
+MAX_CATEGORY_DEPTH = 100
+
+def get_category_ancestors(category):
+	"""Get a category followed by its ancestors, nearest first, in one query"""
+	return frappe.db.sql("""
+		WITH RECURSIVE ancestors AS (
+			SELECT name, parent, category_name, category_code, 0 AS depth
+			FROM `tabArchive Category`
+			WHERE name = %s
+			UNION ALL
+			SELECT c.name, c.parent, c.category_name, c.category_code, a.depth + 1
+			FROM `tabArchive Category` c
+			INNER JOIN ancestors a ON c.name = a.parent
+			WHERE a.depth < %s
+		)
+		SELECT name, category_name, category_code
+		FROM ancestors
+		ORDER BY depth
+	""", (category, MAX_CATEGORY_DEPTH), as_dict=True)
 
 @frappe.whitelist()
 def get_category_tree():
 	"""Get category tree structure"""
+	# Load every active category and all document counts once, then link them up in memory
+	categories = frappe.db.sql("""
+		SELECT name, category_name, description, color, icon, parent AS parent_category
+		FROM `tabArchive Category`
+		WHERE is_active = 1
+		ORDER BY category_name
+	""", as_dict=True)
+	
+	document_counts = dict(frappe.db.sql("""
+		SELECT category, COUNT(*)
+		FROM `tabArchive Document`
+		GROUP BY category
+	"""))
+	
+	children_by_parent = defaultdict(list)
+	for category in categories:
+		category["document_count"] = document_counts.get(category.name, 0)
+		children_by_parent[category.parent_category or None].append(category)
+	
 	def build_tree(parent=None):
-		categories = frappe.get_all("Archive Category",
-			filters={"parent_category": parent, "is_active": 1},
-			fields=["name", "category_name", "description", "color", "icon", "parent_category"],
-			order_by="category_name"
-		)
-		
-		for category in categories:
+		children = children_by_parent.get(parent, [])
+		for category in children:
 			category["children"] = build_tree(category.name)
-			category["document_count"] = frappe.db.count("Archive Document", {"category": category.name})
 		
-		return categories
+		return children
 	
 	return build_tree()
 
@@ -181,21 +238,30 @@ def get_category_documents(category_name, limit=20, offset=0):
 @frappe.whitelist()
 def auto_categorize_document(document_name):
 	"""Auto categorize a document based on rules"""
-	doc = frappe.get_doc("Archive Document", document_name)
+	doc = frappe.db.get_value("Archive Document", document_name,
+		["document_title", "description", "ocr_text", "category"], as_dict=True)
+	if not doc:
+		frappe.throw(_("Archive Document {0} not found").format(document_name))
 	
-	# Get all active categories
+	# Get all active categories, then the rules of all of them in one query
 	categories = frappe.get_all("Archive Category", 
 		filters={"is_active": 1},
-		fields=["name", "category_name"]
+		fields=["name", "category_name", "modified"],
+		order_by="modified desc"
 	)
 	
+	# Lowercase the content once for every category instead of once per category
 	content = f"{doc.document_title} {doc.description or ''} {doc.ocr_text or ''}"
+	content_to_check = f"{doc.document_title} {content}".lower()
+	
+	compiled_rules = get_compiled_rules([category.name for category in categories]) if categories else {}
 	
 	for category in categories:
-		category_doc = frappe.get_doc("Archive Category", category.name)
-		if category_doc.apply_auto_categorization(content, doc.document_title):
-			doc.category = category.name
-			doc.save()
+		rules = compiled_rules.get(category.name)
+		if rules and match_categorization_rules(rules, content_to_check):
+			if category.name != doc.category:
+				from erpnext_archive_system.erpnext_archive_system.doctype.archive_category_rule.archive_category_rule import update_document_categories
+				update_document_categories({document_name: category.name})
 			return {"status": "success", "category": category.category_name}
 	
 	return {"status": "no_match", "message": "No matching category found"}
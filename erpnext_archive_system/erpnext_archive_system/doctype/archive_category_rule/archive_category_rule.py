@@ -1,8 +1,58 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.utils import cint
+import functools
 import re
 
+# Match keyword rules with one Aho-Corasick automaton when pyahocorasick is installed
+try:
+	import ahocorasick
+except ImportError:
+	ahocorasick = None
+
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+	"""Compile a rule pattern once, case insensitive like every rule match"""
+	return re.compile(pattern, re.IGNORECASE)
+
+def match_rule(rule, content_to_check, document_type=""):
+	"""Check a rule, a document or a fetched row, against lowercased document content"""
+	if rule.rule_type == "Keyword":
+		return bool(rule.keyword) and rule.keyword.lower() in content_to_check
+	
+	elif rule.rule_type == "Pattern":
+		try:
+			return bool(compile_pattern(rule.pattern).search(content_to_check))
+		except re.error:
+			return False
+	
+	elif rule.rule_type == "Document Type":
+		return document_type == rule.document_type
+	
+	elif rule.rule_type == "File Extension":
+		# This would need to be implemented based on file extension detection
+		return False
+	
+	elif rule.rule_type == "Content Analysis":
+		# This would need ML-based content analysis
+		return False
+	
+	return False
+
+def get_active_rules():
+	"""Get the active categorization rules with their category, ordered by priority"""
+	rules = frappe.db.sql("""
+		SELECT name, rule_name, rule_type, keyword, pattern, document_type, priority, category
+		FROM `tabArchive Category Rule`
+		WHERE is_active = 1 AND category != ''
+		ORDER BY priority ASC
+	""", as_dict=True)
+	for rule in rules:
+		rule.priority = cint(rule.priority)
+	
+	return rules
+
 class ArchiveCategoryRule(Document):
 	def validate(self):
 		"""Validate rule before saving"""
@@ -35,7 +85,7 @@ class ArchiveCategoryRule(Document):
 		# Validate regex pattern
 		if self.rule_type == "Pattern" and self.pattern:
 			try:
-				re.compile(self.pattern)
+				compile_pattern(self.pattern)
 			except re.error as e:
 				frappe.throw(_("Invalid regex pattern: {0}").format(str(e)))
 	
@@ -43,55 +93,32 @@ class ArchiveCategoryRule(Document):
 		"""Set audit information"""
 		if not self.created_by:
 			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_on = self.modified or frappe.utils.now()
 	
 	def update_modified_info(self):
 		"""Update modification information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
 		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_on = self.modified or frappe.utils.now()
 	
 	def create_rule_audit_log(self, action):
 		"""Create rule audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Rule {action}",
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Rule '{self.rule_name}' {action.lower()}"
-		}
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
 		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		queue_audit_entry(build_audit_entry(f"Rule {action}",
+			details=f"Rule '{self.rule_name}' {action.lower()}"
+		))
 	
-	def apply_rule(self, document_content, document_title="", document_type=""):
+	def apply_rule(self, document_content, document_title="", document_type="", content_to_check=None):
 		"""Apply this rule to determine if document matches"""
 		if not self.is_active:
 			return False
 		
-		content_to_check = f"{document_title} {document_content}".lower()
+		# Callers applying many rules pass the lowercased content once
+		if content_to_check is None:
+			content_to_check = f"{document_title} {document_content}".lower()
 		
-		if self.rule_type == "Keyword":
-			return self.keyword.lower() in content_to_check
-		
-		elif self.rule_type == "Pattern":
-			try:
-				return bool(re.search(self.pattern, content_to_check, re.IGNORECASE))
-			except re.error:
-				return False
-		
-		elif self.rule_type == "Document Type":
-			return document_type == self.document_type
-		
-		elif self.rule_type == "File Extension":
-			# This would need to be implemented based on file extension detection
-			return False
-		
-		elif self.rule_type == "Content Analysis":
-			# This would need ML-based content analysis
-			return False
-		
-		return False
+		return match_rule(self, content_to_check, document_type)
 	
 	def get_rule_summary(self):
 		"""Get rule summary for reporting"""
@@ -120,6 +147,7 @@ def create_rule(rule_name, rule_type, **kwargs):
 			"doctype": "Archive Category Rule",
 			"rule_name": rule_name,
 			"rule_type": rule_type,
+			"category": kwargs.get("category"),
 			"keyword": kwargs.get("keyword"),
 			"pattern": kwargs.get("pattern"),
 			"document_type": kwargs.get("document_type"),
@@ -140,30 +168,28 @@ def create_rule(rule_name, rule_type, **kwargs):
 def apply_rules_to_document(document_name):
 	"""Apply all active rules to a document"""
 	try:
-		doc = frappe.get_doc("Archive Document", document_name)
+		doc = frappe.db.get_value("Archive Document", document_name,
+			["document_title", "description", "ocr_text", "document_type", "category"], as_dict=True)
+		if not doc:
+			return {"status": "error", "message": "Document not found"}
 		
 		# Get all active rules ordered by priority
-		rules = frappe.get_all("Archive Category Rule",
-			filters={"is_active": 1},
-			fields=["name", "rule_name", "rule_type", "keyword", "pattern", "document_type", "priority"],
-			order_by="priority asc"
-		)
+		rules = get_active_rules()
 		
 		content = f"{doc.document_title} {doc.description or ''} {doc.ocr_text or ''}"
+		content_to_check = f"{doc.document_title} {content}".lower()
 		
 		for rule in rules:
-			rule_doc = frappe.get_doc("Archive Category Rule", rule.name)
-			if rule_doc.apply_rule(content, doc.document_title, doc.document_type):
+			if match_rule(rule, content_to_check, doc.document_type):
 				# Rule matched, update document category
-				old_category = doc.category
-				doc.category = rule_doc.parent_category if hasattr(rule_doc, 'parent_category') else doc.category
+				new_category = rule.category or doc.category
 				
-				if old_category != doc.category:
-					doc.save()
+				if new_category != doc.category:
+					update_document_categories({document_name: new_category})
 					return {
 						"status": "success", 
 						"message": f"Document categorized using rule: {rule.rule_name}",
-						"new_category": doc.category
+						"new_category": new_category
 					}
 		
 		return {"status": "no_match", "message": "No rules matched the document"}
@@ -211,35 +237,169 @@ def get_rule_statistics():
 		frappe.log_error(f"Error getting rule statistics: {str(e)}")
 		return []
 
+def build_rule_matcher(rules):
+	"""Build a function returning the first rule by priority that matches a document"""
+	keyword_rules = [rule for rule in rules if rule.rule_type == "Keyword" and rule.keyword]
+	pattern_rules = []
+	document_type_rules = {}
+	
+	for rule in rules:
+		if rule.rule_type == "Pattern" and rule.pattern:
+			try:
+				pattern_rules.append((compile_pattern(rule.pattern), rule))
+			except re.error:
+				continue
+		elif rule.rule_type == "Document Type" and rule.document_type:
+			document_type_rules.setdefault(rule.document_type, rule)
+	
+	# Every keyword is found in a single scan of the content
+	automaton = None
+	if ahocorasick and keyword_rules:
+		automaton = ahocorasick.Automaton()
+		for rule in keyword_rules:
+			keyword = rule.keyword.lower()
+			if not automaton.exists(keyword):
+				automaton.add_word(keyword, rule)
+		automaton.make_automaton()
+	
+	def match(content, document_type=""):
+		content = content.lower()
+		best = document_type_rules.get(document_type)
+		
+		if automaton:
+			for end_index, rule in automaton.iter(content):
+				if best is None or rule.priority < best.priority:
+					best = rule
+		else:
+			for rule in keyword_rules:
+				if best is not None and rule.priority >= best.priority:
+					break
+				if rule.keyword.lower() in content:
+					best = rule
+					break
+		
+		# Rules are ordered by priority, so patterns stop at the first one that cannot win
+		for pattern, rule in pattern_rules:
+			if best is not None and rule.priority >= best.priority:
+				break
+			if pattern.search(content):
+				best = rule
+				break
+		
+		return best
+	
+	return match
+
 @frappe.whitelist()
 def bulk_apply_rules():
 	"""Apply all active rules to all documents"""
 	try:
-		# Get all documents without category or with 'General' category
-		documents = frappe.get_all("Archive Document",
-			filters={"category": ["in", ["", "General"]]},
-			fields=["name", "document_title", "description", "ocr_text", "document_type"]
-		)
-		
 		results = {
-			"total_documents": len(documents),
+			"total_documents": 0,
 			"categorized": 0,
 			"no_match": 0,
 			"errors": 0
 		}
 		
-		for doc in documents:
+		matches = None
+		if frappe.db.db_type == "mariadb":
 			try:
-				result = apply_rules_to_document(doc.name)
-				if result["status"] == "success":
-					results["categorized"] += 1
-				elif result["status"] == "no_match":
-					results["no_match"] += 1
+				matches = match_documents_in_database()
 			except Exception:
-				results["errors"] += 1
+				# A pattern the database regex library rejects, match in Python instead
+				matches = None
+		
+		if matches is None:
+			matches = match_documents_in_python(results)
+		
+		results["total_documents"] += len(matches)
+		
+		new_categories = {}
+		for doc in matches:
+			if doc.new_category and doc.new_category != doc.category:
+				new_categories[doc.name] = doc.new_category
+				results["categorized"] += 1
+			else:
+				results["no_match"] += 1
+		
+		if new_categories:
+			update_document_categories(new_categories)
 		
 		return results
 		
 	except Exception as e:
 		frappe.log_error(f"Error in bulk apply rules: {str(e)}")
-		return {"status": "error", "message": str(e)}
\ No newline at end of file
+		return {"status": "error", "message": str(e)}
+
+def match_documents_in_database():
+	"""Find the category of the first matching rule for every uncategorized document in one query"""
+	return frappe.db.sql("""
+		SELECT d.name, d.category, (
+			SELECT r.category
+			FROM `tabArchive Category Rule` r
+			WHERE r.is_active = 1 AND r.category != ''
+				AND (
+					(r.rule_type = 'Keyword' AND r.keyword != '' AND INSTR(d.content, LOWER(r.keyword)) > 0)
+					OR (r.rule_type = 'Pattern' AND r.pattern != '' AND d.content REGEXP r.pattern)
+					OR (r.rule_type = 'Document Type' AND r.document_type = d.document_type)
+				)
+			ORDER BY r.priority ASC
+			LIMIT 1
+		) AS new_category
+		FROM (
+			SELECT name, category, document_type,
+				LOWER(CONCAT_WS(' ', document_title, description, ocr_text)) AS content
+			FROM `tabArchive Document`
+			WHERE category IN ('', 'General')
+		) d
+	""", as_dict=True)
+
+def match_documents_in_python(results):
+	"""Find the category of the first matching rule for every uncategorized document in Python"""
+	# Get all documents without category or with 'General' category
+	documents = frappe.get_all("Archive Document",
+		filters={"category": ["in", ["", "General"]]},
+		fields=["name", "document_title", "description", "ocr_text", "document_type", "category"]
+	)
+	
+	# Load and compile the rules once for all documents
+	match = build_rule_matcher(get_active_rules())
+	
+	matches = []
+	for doc in documents:
+		try:
+			content = f"{doc.document_title} {doc.description or ''} {doc.ocr_text or ''}"
+			rule = match(content, doc.document_type)
+			matches.append(frappe._dict(name=doc.name, category=doc.category,
+				new_category=rule.category if rule else None))
+		except Exception:
+			results["total_documents"] += 1
+			results["errors"] += 1
+	
+	return matches
+
+def update_document_categories(new_categories):
+	"""Set the category of many documents with a single UPDATE"""
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import (
+		build_audit_entry, queue_audit_entry
+	)
+	
+	names = list(new_categories)
+	modified = frappe.utils.now()
+	
+	frappe.db.sql("""
+		UPDATE `tabArchive Document`
+		SET category = CASE name {cases} END,
+			modified = %s, modified_by = %s,
+			last_modified_on = %s, last_modified_by = %s
+		WHERE name IN %s
+	""".format(cases=" ".join(["WHEN %s THEN %s"] * len(names))),
+		[value for name in names for value in (name, new_categories[name])]
+		+ [modified, frappe.session.user, modified, frappe.session.user, tuple(names)])
+	
+	for name in names:
+		queue_audit_entry(build_audit_entry("Auto Categorized", document_id=name,
+			details=f"Category set to {new_categories[name]}"))
+	
+	from erpnext_archive_system.erpnext_archive_system.api.archive_api import ARCHIVE_STATISTICS_CACHE_KEY
+	frappe.cache().delete_value(ARCHIVE_STATISTICS_CACHE_KEY)
@@ -0,0 +1,10 @@
+frappe.ui.form.on("Archive Document", {
+	setup(frm) {
+		// Show the processed fields on the open form unless it has unsaved edits
+		frappe.realtime.on("archive_progress", (data) => {
+			if (frm.docname === data.document && !frm.is_dirty()) {
+				frm.reload_doc();
+			}
+		});
+	},
+});
@@ -3,74 +3,121 @@ from frappe.model.document import Document
 from frappe import _
 import json
 import os
-from .utils import process_ocr, encrypt_file, decrypt_file, generate_audit_log
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property
+from multiprocessing import get_context
+from .utils import process_ocr, extract_text, init_ocr_worker, encrypt_file, decrypt_file, generate_audit_log, get_site_file_path
+
+# OCR worker processes for bulk OCR, leaving most cores to web and other workers
+BULK_OCR_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+
+# Documents whose OCR text is written per UPDATE
+BULK_OCR_BATCH_SIZE = 50
 
 class ArchiveDocument(Document):
 	def validate(self):
 		"""Validate document before saving"""
-		self.validate_document_id()
 		self.validate_file_attachment()
 		self.set_metadata()
 		
 	def before_save(self):
 		"""Process document before saving"""
-		if self.file_attachment and not self.ocr_text:
-			self.process_ocr()
-		
-		if self.encryption_status != "Encrypted" and self.access_level in ["Confidential", "Restricted"]:
-			self.encrypt_document()
+		# OCR and encryption work through the whole file, so they run in a job once this save commits
+		if (self.file_attachment and not self.ocr_text) or self.needs_encryption():
+			frappe.enqueue(process_document_files, queue="long", timeout=600, enqueue_after_commit=True,
+				job_id=f"archive_document_files::{self.name}", deduplicate=True,
+				docname=self.name, auto_categorize=bool(self.flags.auto_categorize))
+			self.flags.files_queued = True
 		
-		self.update_audit_trail("Document Updated")
+		# Every record of this save carries the save's own timestamp
+		self.update_audit_trail("Document Updated", self.modified)
 	
 	def after_insert(self):
 		"""Process after document creation"""
-		self.update_audit_trail("Document Created")
+		self.update_audit_trail("Document Created", self.modified)
 		self.create_initial_version()
 	
+	def on_update(self):
+		"""Process after document save"""
+		self.clear_statistics_cache()
+	
 	def on_trash(self):
 		"""Process before document deletion"""
 		self.update_audit_trail("Document Deleted")
+		self.clear_statistics_cache()
+	
+	def clear_statistics_cache(self):
+		"""Drop cached archive statistics so they include this change"""
+		from erpnext_archive_system.erpnext_archive_system.api.archive_api import (
+			ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY, ARCHIVE_STATISTICS_CACHE_KEY
+		)
+		frappe.cache().delete_value([ARCHIVE_STATISTICS_CACHE_KEY, ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY])
+	
+	@cached_property
+	def file_docs(self):
+		"""File docs already loaded for this document, keyed by file url"""
+		return {}
 	
-	def validate_document_id(self):
-		"""Ensure document ID is unique"""
-		if frappe.db.exists("Archive Document", {"document_id": self.document_id, "name": ["!=", self.name]}):
-			frappe.throw(_("Document ID {0} already exists").format(self.document_id))
+	def get_file_doc(self):
+		"""Get the File behind file_attachment, loading it once per attachment"""
+		if self.file_attachment not in self.file_docs:
+			self.file_docs[self.file_attachment] = frappe.get_doc("File", {"file_url": self.file_attachment})
+		return self.file_docs[self.file_attachment]
+	
+	def get_file_path(self):
+		"""Resolve file_attachment to a path on disk, from the url alone for site files inside the files directory"""
+		return get_site_file_path(self.file_attachment) or self.get_file_doc().get_full_path()
 	
 	def validate_file_attachment(self):
 		"""Validate file attachment if provided"""
 		if self.file_attachment:
-			file_path = frappe.get_doc("File", {"file_url": self.file_attachment}).get_full_path()
-			if not os.path.exists(file_path):
+			try:
+				os.stat(self.get_file_path())
+			except (OSError, frappe.DoesNotExistError):
 				frappe.throw(_("File attachment not found"))
 	
 	def set_metadata(self):
 		"""Set document metadata"""
-		if not self.metadata:
-			self.metadata = json.dumps({
-				"file_size": self.get_file_size(),
-				"file_type": self.get_file_type(),
-				"created_date": str(self.creation),
-				"last_accessed": str(frappe.utils.now())
-			})
+		if self.is_new() or self.has_value_changed("file_attachment"):
+			self.file_size = self.get_file_size()
+			self.file_type = self.get_file_type()
+		
+		if not self.last_accessed:
+			self.last_accessed = self.modified or frappe.utils.now()
 	
 	def process_ocr(self):
 		"""Process OCR on attached file"""
 		try:
 			if self.file_attachment:
-				file_path = frappe.get_doc("File", {"file_url": self.file_attachment}).get_full_path()
+				file_path = self.get_file_path()
 				ocr_text = process_ocr(file_path)
 				self.ocr_text = ocr_text
-				frappe.msgprint(_("OCR processing completed"))
+				self.publish_progress(_("OCR processing completed"))
 		except Exception as e:
 			frappe.log_error(f"OCR processing failed: {str(e)}")
-			frappe.msgprint(_("OCR processing failed. Please try again."))
+			self.publish_progress(_("OCR processing failed. Please try again."), "red")
+	
+	def publish_progress(self, message, indicator="green"):
+		"""Send a file processing message to the user's desk without adding it to the response"""
+		frappe.publish_realtime("archive_progress", {"document": self.name, "message": message, "indicator": indicator},
+			user=frappe.session.user)
+	
+	def needs_encryption(self):
+		"""Check whether a new or changed attachment of a restricted document still has to be encrypted"""
+		# Failed encryptions are retried through the encrypt action, not on every save
+		if not self.file_attachment or self.encryption_status not in (None, "", "Not Encrypted"):
+			return False
+		
+		if self.access_level not in ["Confidential", "Restricted"]:
+			return False
+		
+		return self.is_new() or self.has_value_changed("access_level") or self.has_value_changed("file_attachment")
 	
 	def encrypt_document(self):
 		"""Encrypt document file"""
 		try:
 			if self.file_attachment:
-				file_doc = frappe.get_doc("File", {"file_url": self.file_attachment})
-				file_path = file_doc.get_full_path()
+				file_path = self.get_file_path()
 				
 				# Encrypt the file
 				encrypted_path = encrypt_file(file_path)
@@ -78,18 +125,17 @@ class ArchiveDocument(Document):
 				# Update file attachment
 				self.file_attachment = encrypted_path
 				self.encryption_status = "Encrypted"
-				frappe.msgprint(_("Document encrypted successfully"))
+				self.publish_progress(_("Document encrypted successfully"))
 		except Exception as e:
 			frappe.log_error(f"Encryption failed: {str(e)}")
 			self.encryption_status = "Encryption Failed"
-			frappe.msgprint(_("Encryption failed. Please try again."))
+			self.publish_progress(_("Encryption failed. Please try again."), "red")
 	
 	def decrypt_document(self):
 		"""Decrypt document file"""
 		try:
 			if self.file_attachment and self.encryption_status == "Encrypted":
-				file_doc = frappe.get_doc("File", {"file_url": self.file_attachment})
-				file_path = file_doc.get_full_path()
+				file_path = self.get_file_path()
 				
 				# Decrypt the file
 				decrypted_path = decrypt_file(file_path)
@@ -97,97 +143,114 @@ class ArchiveDocument(Document):
 				# Update file attachment
 				self.file_attachment = decrypted_path
 				self.encryption_status = "Not Encrypted"
-				frappe.msgprint(_("Document decrypted successfully"))
+				self.publish_progress(_("Document decrypted successfully"))
 		except Exception as e:
 			frappe.log_error(f"Decryption failed: {str(e)}")
-			frappe.msgprint(_("Decryption failed. Please try again."))
+			self.publish_progress(_("Decryption failed. Please try again."), "red")
 	
 	def get_file_size(self):
 		"""Get file size in bytes"""
 		if self.file_attachment:
-			file_doc = frappe.get_doc("File", {"file_url": self.file_attachment})
-			return file_doc.file_size
+			return self.get_file_doc().file_size
 		return 0
 	
 	def get_file_type(self):
 		"""Get file type"""
 		if self.file_attachment:
-			file_doc = frappe.get_doc("File", {"file_url": self.file_attachment})
-			return file_doc.file_name.split('.')[-1].upper()
+			return os.path.splitext(self.get_file_doc().file_name)[1][1:].upper()
 		return ""
 	
 	def create_initial_version(self):
 		"""Create initial version entry"""
-		version_doc = frappe.get_doc({
-			"doctype": "Archive Document Version",
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_document_version.archive_document_version import insert_versions
+		
+		insert_versions([{
 			"parent": self.name,
-			"parentfield": "version_info",
-			"parenttype": "Archive Document",
 			"version_number": 1,
-			"version_date": frappe.utils.now(),
 			"version_notes": "Initial version",
 			"file_url": self.file_attachment,
-			"created_by": frappe.session.user
-		})
-		version_doc.insert(ignore_permissions=True)
+			"file_size": self.file_size,
+			"file_hash": self.file_hash
+		}], self.modified)
 	
-	def update_audit_trail(self, action):
-		"""Update audit trail"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
+	def update_audit_trail(self, action, timestamp=None):
+		"""Queue an audit trail entry, written with the other entries of this transaction"""
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+		
+		audit_entry = build_audit_entry(action, document_id=self.name, details=f"Document {action.lower()}",
+			timestamp=timestamp)
+		audit_entry.update({
 			"parent": self.name,
 			"parentfield": "audit_trail",
-			"parenttype": "Archive Document",
-			"action": action,
-			"timestamp": frappe.utils.now(),
-			"user": frappe.session.user,
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Document {action.lower()}"
-		}
-		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+			"parenttype": "Archive Document"
+		})
+		queue_audit_entry(audit_entry)
 	
 	def search_documents(self, search_term, filters=None):
 		"""Search documents with filters"""
-		query = """
-			SELECT name, document_id, document_title, category, status, created_on
-			FROM `tabArchive Document`
-			WHERE 1=1
-		"""
+		from erpnext_archive_system.erpnext_archive_system.api.archive_api import SEARCH_FILTER_FIELDS, escape_like, get_fulltext_search_term
 		
+		joins = ""
+		conditions = ""
+		order_by = "ad.created_on DESC"
 		params = []
 		
 		if search_term:
-			query += """
-				AND (document_title LIKE %s 
-				OR document_id LIKE %s 
-				OR ocr_text LIKE %s 
-				OR tags LIKE %s)
-			"""
-			search_param = f"%{search_term}%"
-			params.extend([search_param, search_param, search_param, search_param])
+			fulltext_term = get_fulltext_search_term(search_term)
+			
+			if fulltext_term:
+				# Probe the FULLTEXT index, plus document id prefixes it does not cover, best matches first
+				joins = """
+					INNER JOIN (
+						SELECT name FROM `tabArchive Document`
+						WHERE MATCH(document_title, ocr_text, tags, description) AGAINST (%s IN BOOLEAN MODE)
+						UNION
+						SELECT name FROM `tabArchive Document`
+						WHERE document_id LIKE %s
+					) matches ON matches.name = ad.name
+				"""
+				order_by = "MATCH(ad.document_title, ad.ocr_text, ad.tags, ad.description) AGAINST (%s IN BOOLEAN MODE) DESC, ad.created_on DESC"
+				params.extend([fulltext_term, f"{escape_like(search_term)}%"])
+			else:
+				# Words too short for the FULLTEXT index fall back to scanning
+				conditions += """
+					AND (ad.document_title LIKE %s 
+					OR ad.document_id LIKE %s 
+					OR ad.ocr_text LIKE %s 
+					OR ad.tags LIKE %s)
+				"""
+				search_param = f"%{search_term}%"
+				params.extend([search_param, search_param, search_param, search_param])
 		
 		if filters:
 			for field, value in filters.items():
 				if value:
-					query += f" AND {field} = %s"
+					if field not in SEARCH_FILTER_FIELDS:
+						frappe.throw(_("Cannot filter documents by {0}").format(field))
+					
+					conditions += f" AND ad.{field} = %s"
 					params.append(value)
 		
-		query += " ORDER BY created_on DESC"
+		if joins:
+			params.append(fulltext_term)
+		
+		query = f"""
+			SELECT ad.name, ad.document_id, ad.document_title, ad.category, ad.status, ad.created_on
+			FROM `tabArchive Document` ad
+			{joins}
+			WHERE 1=1 {conditions}
+			ORDER BY {order_by}
+		"""
 		
 		return frappe.db.sql(query, params, as_dict=True)
 	
 	def get_related_documents(self):
 		"""Get related documents"""
-		related_docs = []
-		for doc in self.related_documents:
-			related_docs.append({
-				"document_id": doc.related_document_id,
-				"relationship_type": doc.relationship_type,
-				"notes": doc.notes
-			})
-		return related_docs
+		return frappe.get_all("Archive Related Document",
+			filters={"parent": self.name, "parenttype": "Archive Document", "parentfield": "related_documents"},
+			fields=["related_document_id as document_id", "relationship_type", "notes"],
+			order_by="idx"
+		)
 	
 	def add_related_document(self, related_doc_id, relationship_type, notes=""):
 		"""Add related document"""
@@ -215,6 +278,111 @@ def process_document_ocr(docname):
 	doc.save()
 	return {"status": "success", "message": "OCR processing completed"}
 
+def process_document_files(docname, auto_categorize=False):
+	"""Run the OCR and encryption queued by a document save"""
+	doc = frappe.get_doc("Archive Document", docname)
+	
+	if doc.file_attachment and not doc.ocr_text:
+		doc.process_ocr()
+	
+	if doc.needs_encryption():
+		doc.encrypt_document()
+	
+	# Written directly so the save hooks do not queue this job again
+	doc.db_set({
+		"ocr_text": doc.ocr_text,
+		"file_attachment": doc.file_attachment,
+		"encryption_status": doc.encryption_status
+	})
+	
+	# Categorization waits for the OCR text it matches against
+	if auto_categorize:
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_category.archive_category import auto_categorize_document
+		auto_categorize_document(docname)
+
+@frappe.whitelist()
+def bulk_process_ocr(docnames):
+	"""Queue OCR for several documents"""
+	if isinstance(docnames, str):
+		docnames = json.loads(docnames)
+	
+	# The job writes OCR text with a raw UPDATE, so write permission is checked here
+	for docname in docnames:
+		frappe.has_permission("Archive Document", "write", docname, throw=True)
+	
+	frappe.enqueue(process_documents_ocr, queue="long", timeout=3600, docnames=docnames)
+	return {"status": "success", "message": "OCR processing queued"}
+
+def process_documents_ocr(docnames):
+	"""Run OCR for several documents in parallel worker processes"""
+	documents = frappe.get_all("Archive Document",
+		filters={"name": ["in", docnames], "file_attachment": ["is", "set"]},
+		fields=["name", "file_attachment"]
+	)
+	
+	file_paths = {}
+	for document in documents:
+		file_paths[document.name] = get_site_file_path(document.file_attachment)
+	
+	# Attachments outside the site files folder are resolved through their File records, fetched in one query
+	unresolved_urls = {document.file_attachment for document in documents if not file_paths[document.name]}
+	if unresolved_urls:
+		file_docs = {
+			file.file_url: frappe.get_doc(dict(file, doctype="File"))
+			for file in frappe.get_all("File",
+				filters={"file_url": ["in", list(unresolved_urls)]},
+				fields=["name", "file_url", "file_name", "is_private"]
+			)
+		}
+		
+		for document in documents:
+			if file_paths[document.name]:
+				continue
+			
+			try:
+				file_paths[document.name] = file_docs[document.file_attachment].get_full_path()
+			except Exception as e:
+				del file_paths[document.name]
+				frappe.log_error(f"OCR processing failed for {document.name}: File not found: {str(e)}")
+	
+	# Tesseract is CPU bound, so pages are spread over processes rather than threads.
+	# Spawned workers only run extract_text and never share this job's database connection.
+	with ProcessPoolExecutor(max_workers=BULK_OCR_WORKERS, mp_context=get_context("spawn"), initializer=init_ocr_worker) as executor:
+		futures = {executor.submit(extract_text, file_path): name for name, file_path in file_paths.items()}
+		
+		ocr_texts = {}
+		for future in as_completed(futures):
+			name = futures[future]
+			try:
+				ocr_texts[name] = future.result()
+			except Exception as e:
+				frappe.log_error(f"OCR processing failed for {name}: {str(e)}")
+			
+			if len(ocr_texts) >= BULK_OCR_BATCH_SIZE:
+				update_ocr_texts(ocr_texts)
+				ocr_texts = {}
+		
+		update_ocr_texts(ocr_texts)
+
+def update_ocr_texts(ocr_texts):
+	"""Store the OCR text of many documents with a single UPDATE"""
+	if not ocr_texts:
+		return
+	
+	names = list(ocr_texts)
+	modified = frappe.utils.now()
+	
+	frappe.db.sql("""
+		UPDATE `tabArchive Document`
+		SET ocr_text = CASE name {cases} END,
+			modified = %s, modified_by = %s,
+			last_modified_on = %s, last_modified_by = %s
+		WHERE name IN %s
+	""".format(cases=" ".join(["WHEN %s THEN %s"] * len(names))),
+		[value for name in names for value in (name, ocr_texts[name])]
+		+ [modified, frappe.session.user, modified, frappe.session.user, tuple(names)])
+	frappe.db.commit()
+
 @frappe.whitelist()
 def encrypt_document(docname):
 	"""Encrypt a document"""
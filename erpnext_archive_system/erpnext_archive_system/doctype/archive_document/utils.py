@@ -1,66 +1,102 @@
 import frappe
+import os
 import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
-import os
 import json
+import threading
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import base64
+import functools
+import struct
 from frappe.utils import cstr
 
+try:
+	from tesserocr import PSM, PyTessBaseAPI
+except ImportError:
+	PyTessBaseAPI = None
+
+try:
+	import ahocorasick
+except ImportError:
+	ahocorasick = None
+
+# Tesseract API handles are not thread safe, each thread keeps its own
+tesseract_apis = threading.local()
+
 def process_ocr(file_path):
 	"""Process OCR on image/document file"""
 	try:
-		# Check if file is an image
-		image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']
-		file_ext = os.path.splitext(file_path)[1].lower()
-		
-		if file_ext in image_extensions:
-			# Process image with OCR
-			image = cv2.imread(file_path)
-			
-			# Preprocess image for better OCR
-			gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-			denoised = cv2.medianBlur(gray, 3)
-			
-			# Apply threshold
-			thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-			
-			# OCR processing
-			text = pytesseract.image_to_string(thresh, config='--psm 6')
-			
-			return text.strip()
-		
-		else:
-			# For PDF files, you might want to use pdf2image or PyPDF2
-			# This is a placeholder for PDF OCR processing
-			return "PDF OCR processing not implemented yet"
-			
+		return extract_text(file_path)
 	except Exception as e:
 		frappe.log_error(f"OCR processing error: {str(e)}")
 		return ""
 
-def encrypt_file(file_path):
-	"""Encrypt file using Fernet encryption"""
-	try:
-		# Generate or retrieve encryption key
-		key = get_encryption_key()
-		fernet = Fernet(key)
+def init_ocr_worker():
+	"""Limit Tesseract to one OpenMP thread in a bulk OCR worker process"""
+	# The workers already run in parallel, so Tesseract's own threads would only fight each other
+	os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def extract_text(file_path):
+	"""Extract the text of an image/document file, without touching the site"""
+	# Check if file is an image
+	image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']
+	file_ext = os.path.splitext(file_path)[1].lower()
+	
+	if file_ext in image_extensions:
+		# Process image with OCR, decoding straight to grayscale rather than converting a BGR copy
+		gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
 		
-		# Read file content
-		with open(file_path, 'rb') as file:
-			file_data = file.read()
+		# Preprocess image for better OCR
+		denoised = cv2.medianBlur(gray, 3)
 		
-		# Encrypt file data
-		encrypted_data = fernet.encrypt(file_data)
+		# Apply threshold
+		thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 		
+		# OCR processing
+		text = image_to_text(thresh)
+		
+		return text.strip()
+	
+	else:
+		# For PDF files, you might want to use pdf2image or PyPDF2
+		# This is a placeholder for PDF OCR processing
+		return "PDF OCR processing not implemented yet"
+
+def image_to_text(image):
+	"""Run Tesseract on a preprocessed image"""
+	if PyTessBaseAPI is None:
+		return pytesseract.image_to_string(image, config='--psm 6')
+	
+	# tesserocr reuses a loaded Tesseract in process, without a subprocess and a temporary image file
+	api = get_tesseract_api()
+	api.SetImage(Image.fromarray(image))
+	return api.GetUTF8Text()
+
+def get_tesseract_api():
+	"""Get this thread's Tesseract API, loading the language data on first use"""
+	api = getattr(tesseract_apis, "api", None)
+	if api is None:
+		api = tesseract_apis.api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK)
+	return api
+
+# Header of files written by stream_encrypt, older encrypted files are a single Fernet token
+STREAM_ENCRYPTION_MAGIC = b"ARCHGCM1"
+
+# Plaintext bytes sealed per AES-GCM record
+STREAM_ENCRYPTION_CHUNK_SIZE = 1024 * 1024
+
+def encrypt_file(file_path):
+	"""Encrypt file using streamed AES-GCM encryption"""
+	try:
 		# Create encrypted file path
 		encrypted_path = file_path + '.encrypted'
 		
-		# Write encrypted data
-		with open(encrypted_path, 'wb') as file:
-			file.write(encrypted_data)
+		# Encrypt the file a chunk at a time
+		with open(file_path, 'rb') as source, open(encrypted_path, 'wb') as destination:
+			stream_encrypt(source, destination, get_aesgcm())
 		
 		return encrypted_path
 		
@@ -69,25 +105,18 @@ def encrypt_file(file_path):
 		raise e
 
 def decrypt_file(encrypted_file_path):
-	"""Decrypt file using Fernet encryption"""
+	"""Decrypt file encrypted by encrypt_file"""
 	try:
-		# Generate or retrieve encryption key
-		key = get_encryption_key()
-		fernet = Fernet(key)
-		
-		# Read encrypted file content
-		with open(encrypted_file_path, 'rb') as file:
-			encrypted_data = file.read()
-		
-		# Decrypt file data
-		decrypted_data = fernet.decrypt(encrypted_data)
-		
 		# Create decrypted file path
 		decrypted_path = encrypted_file_path.replace('.encrypted', '_decrypted')
 		
-		# Write decrypted data
-		with open(decrypted_path, 'wb') as file:
-			file.write(decrypted_data)
+		with open(encrypted_file_path, 'rb') as source, open(decrypted_path, 'wb') as destination:
+			if source.read(len(STREAM_ENCRYPTION_MAGIC)) == STREAM_ENCRYPTION_MAGIC:
+				stream_decrypt(source, destination, get_aesgcm())
+			else:
+				# Files encrypted before streaming are one Fernet token
+				source.seek(0)
+				destination.write(get_fernet().decrypt(source.read()))
 		
 		return decrypted_path
 		
@@ -95,36 +124,166 @@ def decrypt_file(encrypted_file_path):
 		frappe.log_error(f"File decryption error: {str(e)}")
 		raise e
 
+def stream_encrypt(source, destination, aesgcm):
+	"""Encrypt a file object into length, nonce and sealed chunk records"""
+	destination.write(STREAM_ENCRYPTION_MAGIC)
+	
+	index = 0
+	chunk = source.read(STREAM_ENCRYPTION_CHUNK_SIZE)
+	while True:
+		next_chunk = source.read(STREAM_ENCRYPTION_CHUNK_SIZE)
+		is_last = not next_chunk
+		
+		# The record index and last flag are authenticated, so records cannot be reordered or dropped
+		nonce = os.urandom(12)
+		record = aesgcm.encrypt(nonce, chunk, struct.pack(">Q?", index, is_last))
+		destination.write(struct.pack(">I", len(record)))
+		destination.write(nonce)
+		destination.write(record)
+		
+		if is_last:
+			break
+		
+		chunk = next_chunk
+		index += 1
+
+def stream_decrypt(source, destination, aesgcm):
+	"""Decrypt the records written by stream_encrypt"""
+	file_size = os.fstat(source.fileno()).st_size
+	
+	index = 0
+	while True:
+		header = source.read(4)
+		nonce = source.read(12)
+		if len(header) < 4 or len(nonce) < 12:
+			raise ValueError("Encrypted file is truncated")
+		
+		record = source.read(struct.unpack(">I", header)[0])
+		is_last = source.tell() >= file_size
+		destination.write(aesgcm.decrypt(nonce, record, struct.pack(">Q?", index, is_last)))
+		
+		if is_last:
+			break
+		
+		index += 1
+
+def get_aesgcm():
+	"""Get the AES-GCM cipher for the site's encryption key"""
+	return build_aesgcm(get_encryption_key_raw())
+
+@functools.lru_cache(maxsize=32)
+def build_aesgcm(key):
+	"""Build an AES-256-GCM cipher once per key"""
+	return AESGCM(key)
+
+def get_fernet():
+	"""Get the Fernet instance for the site's encryption key"""
+	return build_fernet(get_encryption_key())
+
+@functools.lru_cache(maxsize=32)
+def build_fernet(key):
+	"""Build a Fernet instance once per key"""
+	return Fernet(key)
+
 def get_encryption_key():
-	"""Get or generate encryption key"""
-	# In production, store this key securely
-	key = frappe.get_conf().get('archive_encryption_key')
+	"""Get the encryption key in Fernet's url-safe base64 form"""
+	return base64.urlsafe_b64encode(get_encryption_key_raw())
+
+# Parsed encryption keys by site, the key never changes while a worker is running
+encryption_keys = {}
+
+def get_encryption_key_raw():
+	"""Get the site's raw 32 byte encryption key"""
+	site = frappe.local.site
+	key = encryption_keys.get(site)
 	
-	if not key:
-		# Generate new key
-		key = Fernet.generate_key()
-		# Store key in site config (in production, use a secure key management system)
-		frappe.conf.archive_encryption_key = key.decode()
-		frappe.db.commit()
+	if key is None:
+		# Keys are only generated by generate-archive-key and after_install, never on a request
+		key = frappe.get_conf().get('archive_encryption_key')
+		if not key:
+			frappe.throw(frappe._("Archive encryption key is not configured. Run bench --site {0} generate-archive-key").format(site))
+		
+		key = encryption_keys[site] = parse_encryption_key(key)
+	
+	return key
+
+def parse_encryption_key(key):
+	"""Decode a configured encryption key to raw bytes"""
+	if isinstance(key, bytes):
+		key = key.decode()
 	
-	return key.encode() if isinstance(key, str) else key
+	# Keys are stored hex encoded, sites set up before AES-GCM still hold a Fernet key
+	if len(key) == 64:
+		return bytes.fromhex(key)
+	return base64.urlsafe_b64decode(key)
+
+def ensure_encryption_key():
+	"""Generate and store the site's encryption key unless one is configured, returns True when generated"""
+	from frappe.installer import update_site_config
+	
+	if frappe.get_conf().get('archive_encryption_key'):
+		return False
+	
+	# In production, back this key up or move it to a secure key management system
+	update_site_config('archive_encryption_key', os.urandom(32).hex())
+	return True
+
+def get_site_file_path(file_url):
+	"""Map a /files/ or /private/files/ url to its path in the site, None for any url that cannot be verified"""
+	if file_url.startswith("/private/files/"):
+		is_private, file_name = 1, file_url[len("/private/files/"):]
+	elif file_url.startswith("/files/"):
+		is_private, file_name = 0, file_url[len("/files/"):]
+	else:
+		return None
+	
+	# Only a path that resolves inside the files directory is trusted, anything else goes through its File record
+	files_path = os.path.realpath(frappe.utils.get_files_path(is_private=is_private))
+	file_path = os.path.realpath(os.path.join(files_path, file_name))
+	if file_path == files_path or os.path.commonpath([files_path, file_path]) != files_path:
+		return None
+	
+	return file_path
 
 def generate_audit_log(action, document_id, user=None, details=None):
 	"""Generate audit log entry"""
-	audit_entry = {
-		"doctype": "Archive Audit Trail",
-		"action": action,
-		"document_id": document_id,
-		"user": user or frappe.session.user,
-		"timestamp": frappe.utils.now(),
-		"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-		"details": details or f"Action: {action}"
-	}
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+	
+	audit_entry = build_audit_entry(action, document_id=document_id, details=details or f"Action: {action}")
+	if user:
+		audit_entry["user"] = user
 	
-	audit_doc = frappe.get_doc(audit_entry)
-	audit_doc.insert(ignore_permissions=True)
+	queue_audit_entry(audit_entry)
+	
+	return audit_entry["name"]
+
+# Keywords of the built-in categories, earlier categories win when several match
+CATEGORY_KEYWORDS = {
+	"Financial": ["invoice", "payment", "receipt", "financial", "budget", "expense"],
+	"Legal": ["contract", "agreement", "legal", "terms", "conditions", "law"],
+	"HR": ["employee", "hr", "personnel", "salary", "benefits", "policy"],
+	"Technical": ["technical", "specification", "manual", "guide", "documentation"],
+	"Administrative": ["admin", "administrative", "procedure", "policy", "guideline"]
+}
+
+# Categories in the order they are tried
+CATEGORY_ORDER = tuple(CATEGORY_KEYWORDS)
+
+def build_category_automaton():
+	"""Build one Aho-Corasick automaton mapping every keyword to its category's rank"""
+	if ahocorasick is None:
+		return None
 	
-	return audit_doc.name
+	automaton = ahocorasick.Automaton()
+	for rank, keywords in enumerate(CATEGORY_KEYWORDS.values()):
+		for keyword in keywords:
+			if not automaton.exists(keyword):
+				automaton.add_word(keyword, rank)
+	automaton.make_automaton()
+	return automaton
+
+# Matches all category keywords in one scan of the content when pyahocorasick is installed
+CATEGORY_AUTOMATON = build_category_automaton()
 
 def categorize_document(document_content, document_type):
 	"""Automatically categorize document based on content"""
@@ -132,17 +291,19 @@ def categorize_document(document_content, document_type):
 		# This is a simplified categorization logic
 		# In production, you might want to use ML models for better categorization
 		
-		category_keywords = {
-			"Financial": ["invoice", "payment", "receipt", "financial", "budget", "expense"],
-			"Legal": ["contract", "agreement", "legal", "terms", "conditions", "law"],
-			"HR": ["employee", "hr", "personnel", "salary", "benefits", "policy"],
-			"Technical": ["technical", "specification", "manual", "guide", "documentation"],
-			"Administrative": ["admin", "administrative", "procedure", "policy", "guideline"]
-		}
-		
 		content_lower = document_content.lower()
 		
-		for category, keywords in category_keywords.items():
+		if CATEGORY_AUTOMATON is not None:
+			best_rank = None
+			for end_index, rank in CATEGORY_AUTOMATON.iter(content_lower):
+				if best_rank is None or rank < best_rank:
+					best_rank = rank
+					if rank == 0:
+						break
+			
+			return "General" if best_rank is None else CATEGORY_ORDER[best_rank]
+		
+		for category, keywords in CATEGORY_KEYWORDS.items():
 			if any(keyword in content_lower for keyword in keywords):
 				return category
 		
@@ -155,23 +316,26 @@ def categorize_document(document_content, document_type):
 def extract_metadata(file_path):
 	"""Extract metadata from file"""
 	try:
+		# One stat call answers size and both times
+		file_stat = os.stat(file_path)
 		metadata = {
-			"file_size": os.path.getsize(file_path),
+			"file_size": file_stat.st_size,
 			"file_extension": os.path.splitext(file_path)[1],
 			"file_name": os.path.basename(file_path),
-			"creation_time": os.path.getctime(file_path),
-			"modification_time": os.path.getmtime(file_path)
+			"creation_time": file_stat.st_ctime,
+			"modification_time": file_stat.st_mtime
 		}
 		
 		# Add image-specific metadata
 		if metadata["file_extension"].lower() in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
 			try:
-				image = Image.open(file_path)
-				metadata.update({
-					"image_width": image.width,
-					"image_height": image.height,
-					"image_mode": image.mode
-				})
+				# Only the header is parsed, and the file is closed right away instead of on garbage collection
+				with Image.open(file_path) as image:
+					metadata.update({
+						"image_width": image.width,
+						"image_height": image.height,
+						"image_mode": image.mode
+					})
 			except Exception:
 				pass
 		
@@ -181,10 +345,13 @@ def extract_metadata(file_path):
 		frappe.log_error(f"Metadata extraction error: {str(e)}")
 		return {}
 
+# Extensions validate_file_type accepts when no list is given
+DEFAULT_ALLOWED_FILE_TYPES = frozenset(('.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx', '.txt', '.xlsx', '.xls'))
+
 def validate_file_type(file_path, allowed_types=None):
 	"""Validate file type"""
 	if not allowed_types:
-		allowed_types = ['.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx', '.txt', '.xlsx', '.xls']
+		allowed_types = DEFAULT_ALLOWED_FILE_TYPES
 	
 	file_ext = os.path.splitext(file_path)[1].lower()
 	return file_ext in allowed_types
@@ -1,6 +1,12 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+import functools
+
+@functools.lru_cache(maxsize=256)
+def get_allowed_file_type_set(allowed_file_types):
+	"""Parse a comma separated allowed file types value once into a set of bare extensions"""
+	return frozenset(ft.strip().lstrip('.').lower() for ft in allowed_file_types.split(','))
 
 class ArchiveDocumentType(Document):
 	def validate(self):
@@ -17,10 +23,22 @@ class ArchiveDocumentType(Document):
 		"""Process after document type creation"""
 		self.create_document_type_audit_log("Document Type Created")
 	
+	def on_update(self):
+		"""Process after document type save"""
+		self.clear_lookup_cache()
+	
 	def on_trash(self):
 		"""Process before document type deletion"""
 		self.validate_document_type_deletion()
 		self.create_document_type_audit_log("Document Type Deleted")
+		self.clear_lookup_cache()
+	
+	def clear_lookup_cache(self):
+		"""Drop the cached document type list and statistics so they include this change"""
+		from erpnext_archive_system.erpnext_archive_system.api.archive_api import (
+			ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY, ARCHIVE_DOCUMENT_TYPES_CACHE_KEY
+		)
+		frappe.cache().delete_value([ARCHIVE_DOCUMENT_TYPES_CACHE_KEY, ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY])
 	
 	def validate_document_type_code(self):
 		"""Ensure document type code is unique"""
@@ -43,12 +61,13 @@ class ArchiveDocumentType(Document):
 		"""Set audit information"""
 		if not self.created_by:
 			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_on = self.modified or frappe.utils.now()
 	
 	def update_modified_info(self):
 		"""Update modification information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
 		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_on = self.modified or frappe.utils.now()
 	
 	def validate_document_type_deletion(self):
 		"""Validate if document type can be deleted"""
@@ -59,17 +78,11 @@ class ArchiveDocumentType(Document):
 	
 	def create_document_type_audit_log(self, action):
 		"""Create document type audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Document Type {action}",
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Document Type '{self.document_type_name}' {action.lower()}"
-		}
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
 		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		queue_audit_entry(build_audit_entry(f"Document Type {action}",
+			details=f"Document Type '{self.document_type_name}' {action.lower()}"
+		))
 	
 	def get_allowed_file_types_list(self):
 		"""Get list of allowed file types"""
@@ -83,10 +96,8 @@ class ArchiveDocumentType(Document):
 		if not self.allowed_file_types:
 			return True
 		
-		allowed_types = self.get_allowed_file_types_list()
 		file_ext = file_extension.lower().replace('.', '')
-		
-		return file_ext in allowed_types
+		return file_ext in get_allowed_file_type_set(self.allowed_file_types)
 	
 	def validate_file_size(self, file_size_bytes):
 		"""Validate if file size is within limits"""
@@ -153,28 +164,43 @@ def create_document_type(document_type_name, document_type_code, **kwargs):
 @frappe.whitelist()
 def get_document_type_statistics():
 	"""Get document type statistics"""
+	from erpnext_archive_system.erpnext_archive_system.api.archive_api import (
+		ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY, get_cached_value
+	)
+	
 	try:
-		stats = frappe.db.sql("""
-			SELECT 
-				dt.name,
-				dt.document_type_name,
-				dt.document_type_code,
-				dt.is_active,
-				COUNT(d.name) as document_count,
-				SUM(CASE WHEN d.status = 'Active' THEN 1 ELSE 0 END) as active_documents,
-				SUM(CASE WHEN d.access_level = 'Confidential' THEN 1 ELSE 0 END) as confidential_documents
-			FROM `tabArchive Document Type` dt
-			LEFT JOIN `tabArchive Document` d ON dt.name = d.document_type
-			GROUP BY dt.name, dt.document_type_name, dt.document_type_code, dt.is_active
-			ORDER BY document_count DESC
-		""", as_dict=True)
-		
-		return stats
+		return get_cached_value(ARCHIVE_DOCUMENT_TYPE_STATISTICS_CACHE_KEY, compute_document_type_statistics)
 		
 	except Exception as e:
 		frappe.log_error(f"Error getting document type statistics: {str(e)}")
 		return []
 
+def compute_document_type_statistics():
+	"""Count documents per document type"""
+	# Documents are counted per type from the archive_document_type_statistics index alone,
+	# then joined to the much smaller document type table
+	return frappe.db.sql("""
+		SELECT 
+			dt.name,
+			dt.document_type_name,
+			dt.document_type_code,
+			dt.is_active,
+			COALESCE(d.document_count, 0) as document_count,
+			COALESCE(d.active_documents, 0) as active_documents,
+			COALESCE(d.confidential_documents, 0) as confidential_documents
+		FROM `tabArchive Document Type` dt
+		LEFT JOIN (
+			SELECT
+				document_type,
+				COUNT(*) as document_count,
+				COUNT(CASE WHEN status = 'Active' THEN 1 END) as active_documents,
+				COUNT(CASE WHEN access_level = 'Confidential' THEN 1 END) as confidential_documents
+			FROM `tabArchive Document`
+			GROUP BY document_type
+		) d ON d.document_type = dt.name
+		ORDER BY document_count DESC
+	""", as_dict=True)
+
 @frappe.whitelist()
 def validate_document_file(document_type_name, file_extension, file_size):
 	"""Validate a file against document type requirements"""
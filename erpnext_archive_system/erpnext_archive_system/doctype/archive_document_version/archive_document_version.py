@@ -3,8 +3,24 @@ from frappe.model.document import Document
 from frappe import _
 import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 from frappe.utils import cstr
 
+# Archive Document Version columns written by insert_versions
+DOCUMENT_VERSION_FIELDS = (
+	"name", "creation", "modified", "owner", "modified_by",
+	"parent", "parentfield", "parenttype", "idx",
+	"version_number", "version_date", "version_notes", "file_url", "file_size", "file_hash",
+	"encryption_status", "created_by", "created_on", "last_modified_by", "last_modified_on",
+	"change_summary", "is_current_version", "version_status"
+)
+
+# Audit trail action and details wording for each version event, built once instead of on every save
+VERSION_AUDIT_ACTIONS = {
+	"Version Created": ("Version Version Created", "version created"),
+	"Version Deleted": ("Version Version Deleted", "version deleted")
+}
+
 class ArchiveDocumentVersion(Document):
 	def validate(self):
 		"""Validate version before saving"""
@@ -28,40 +44,44 @@ class ArchiveDocumentVersion(Document):
 	def validate_version_number(self):
 		"""Ensure version number is unique for the parent document"""
 		if self.parent:
-			existing_versions = frappe.get_all("Archive Document Version",
-				filters={
-					"parent": self.parent,
-					"parentfield": "version_info",
-					"version_number": self.version_number,
-					"name": ["!=", self.name]
-				}
-			)
+			existing_version = frappe.db.get_value("Archive Document Version", {
+				"parent": self.parent,
+				"parentfield": "version_info",
+				"version_number": self.version_number,
+				"name": ["!=", self.name]
+			}, "name")
 			
-			if existing_versions:
+			if existing_version:
 				frappe.throw(_("Version number {0} already exists for this document").format(self.version_number))
 	
 	def set_file_hash(self):
 		"""Set file hash for integrity verification"""
+		# A new version created from uploaded bytes already carries their hash
+		if self.is_new() and self.file_hash:
+			return
+		
 		if self.file_url:
 			try:
 				file_doc = frappe.get_doc("File", {"file_url": self.file_url})
 				file_path = file_doc.get_full_path()
 				
 				if os.path.exists(file_path):
-					with open(file_path, 'rb') as f:
-						file_content = f.read()
-						self.file_hash = hashlib.sha256(file_content).hexdigest()
+					self.file_hash = get_file_sha256(file_path)
 			except Exception as e:
 				frappe.log_error(f"Error calculating file hash: {str(e)}")
 	
 	def set_audit_info(self):
 		"""Set audit information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
+		now = self.modified or frappe.utils.now()
+		user = frappe.session.user
+		
 		if not self.created_by:
-			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_by = user
+			self.created_on = now
 		
-		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_by = user
+		self.last_modified_on = now
 	
 	def update_other_versions(self):
 		"""Update other versions to not be current"""
@@ -69,24 +89,21 @@ class ArchiveDocumentVersion(Document):
 			frappe.db.sql("""
 				UPDATE `tabArchive Document Version`
 				SET is_current_version = 0
-				WHERE parent = %s AND name != %s
+				WHERE parent = %s AND is_current_version = 1 AND name != %s
 			""", (self.parent, self.name))
 	
 	def create_version_audit_log(self, action):
 		"""Create version audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Version {action}",
-			"document_id": self.parent,
-			"version_number": self.version_number,
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Version {self.version_number} {action.lower()}"
-		}
-		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+		
+		audit_action, event = VERSION_AUDIT_ACTIONS[action]
+		
+		# Buffered and written with the transaction's other audit entries in one INSERT
+		queue_audit_entry(build_audit_entry(audit_action,
+			document_id=self.parent,
+			version_number=self.version_number,
+			details=f"Version {self.version_number} {event}"
+		))
 	
 	def get_file_integrity_status(self):
 		"""Check file integrity using hash"""
@@ -95,19 +112,7 @@ class ArchiveDocumentVersion(Document):
 		
 		try:
 			file_doc = frappe.get_doc("File", {"file_url": self.file_url})
-			file_path = file_doc.get_full_path()
-			
-			if os.path.exists(file_path):
-				with open(file_path, 'rb') as f:
-					file_content = f.read()
-					current_hash = hashlib.sha256(file_content).hexdigest()
-				
-				if current_hash == self.file_hash:
-					return "Integrity verified"
-				else:
-					return "Integrity check failed"
-			else:
-				return "File not found"
+			return check_file_integrity_status(file_doc.get_full_path(), self.file_hash, self.file_size)
 		except Exception as e:
 			frappe.log_error(f"File integrity check error: {str(e)}")
 			return "Error checking integrity"
@@ -115,7 +120,13 @@ class ArchiveDocumentVersion(Document):
 	def get_version_comparison(self, other_version_name):
 		"""Compare this version with another version"""
 		try:
-			other_version = frappe.get_doc("Archive Document Version", other_version_name)
+			other_version = frappe.db.get_value("Archive Document Version", other_version_name,
+				["version_number", "version_date", "file_size", "created_by", "version_notes", "encryption_status"],
+				as_dict=True
+			)
+			
+			if not other_version:
+				frappe.throw(_("Version {0} not found").format(other_version_name))
 			
 			comparison = {
 				"current_version": {
@@ -149,27 +160,98 @@ class ArchiveDocumentVersion(Document):
 			frappe.log_error(f"Version comparison error: {str(e)}")
 			return {"error": "Comparison failed"}
 
+# Files hashed at once by batch_verify_integrity, hashlib releases the GIL while hashing a chunk
+INTEGRITY_CHECK_WORKERS = os.cpu_count() or 1
+
+# Bytes read per step while hashing a version file
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+def get_file_sha256(file_path):
+	"""Hash a file in fixed size chunks, so memory stays flat whatever the file size"""
+	sha256 = hashlib.sha256()
+	buffer = memoryview(bytearray(FILE_HASH_CHUNK_SIZE))
+	
+	# readinto refills the one buffer instead of allocating a bytes object per chunk
+	with open(file_path, 'rb', buffering=0) as f:
+		while size := f.readinto(buffer):
+			sha256.update(buffer[:size])
+	
+	return sha256.hexdigest()
+
+def check_file_integrity_status(file_path, file_hash, file_size=None):
+	"""Compare a file on disk with its recorded hash, safe to run outside the request thread"""
+	try:
+		current_size = os.stat(file_path).st_size
+	except FileNotFoundError:
+		return "File not found"
+	
+	# A changed size already proves tampering, without reading the file
+	if file_size and current_size != int(file_size):
+		return "Integrity check failed"
+	
+	if get_file_sha256(file_path) == file_hash:
+		return "Integrity verified"
+	else:
+		return "Integrity check failed"
+
+def insert_versions(versions, now=None):
+	"""Insert prepared versions with a single multi-row INSERT, queuing their audit entries"""
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+	
+	# Values that validate would set are filled in here instead
+	values = []
+	now = now or frappe.utils.now()
+	user = frappe.session.user
+	for version in versions:
+		version_number = version["version_number"]
+		values.append((
+			frappe.generate_hash(length=10),
+			now,
+			now,
+			user,
+			user,
+			version["parent"],
+			"version_info",
+			"Archive Document",
+			version_number,
+			version_number,
+			now,
+			version.get("version_notes"),
+			version.get("file_url"),
+			version.get("file_size") or 0,
+			version.get("file_hash"),
+			version.get("encryption_status"),
+			user,
+			now,
+			user,
+			now,
+			version.get("change_summary"),
+			version.get("is_current_version") or 0,
+			version.get("version_status") or "Published"
+		))
+		
+		# Worded like the entries of versions inserted as documents
+		audit_action, event = VERSION_AUDIT_ACTIONS["Version Created"]
+		queue_audit_entry(build_audit_entry(audit_action, document_id=version["parent"],
+			version_number=version_number, details=f"Version {version_number} {event}", timestamp=now))
+	
+	frappe.db.bulk_insert("Archive Document Version", DOCUMENT_VERSION_FIELDS, values)
+
 @frappe.whitelist()
-def create_new_version(parent_document, file_url, version_notes="", change_summary=""):
+def create_new_version(parent_document, file_url, version_notes="", change_summary="", file_hash=None):
 	"""Create a new version of a document"""
 	try:
-		# Get the next version number
-		last_version = frappe.get_all("Archive Document Version",
-			filters={"parent": parent_document},
-			fields=["version_number"],
-			order_by="version_number desc",
-			limit=1
-		)
-		
-		next_version_number = 1
-		if last_version:
-			next_version_number = last_version[0].version_number + 1
+		# Get the next version number, MAX is read from the end of the (parent, version_number) index
+		next_version_number = frappe.db.sql("""
+			SELECT COALESCE(MAX(version_number), 0) + 1
+			FROM `tabArchive Document Version`
+			WHERE parent = %s
+		""", (parent_document,))[0][0]
 		
 		# Get file size
 		file_size = 0
 		if file_url:
-			file_doc = frappe.get_doc("File", {"file_url": file_url})
-			file_size = file_doc.file_size
+			file_size = frappe.db.get_value("File", {"file_url": file_url}, "file_size") or 0
 		
 		# Create new version
 		version_doc = frappe.get_doc({
@@ -182,6 +264,7 @@ def create_new_version(parent_document, file_url, version_notes="", change_summa
 			"version_notes": version_notes,
 			"file_url": file_url,
 			"file_size": file_size,
+			"file_hash": file_hash,
 			"change_summary": change_summary,
 			"is_current_version": 1,
 			"version_status": "Published"
@@ -192,6 +275,7 @@ def create_new_version(parent_document, file_url, version_notes="", change_summa
 		# Update the parent document
 		parent_doc = frappe.get_doc("Archive Document", parent_document)
 		parent_doc.file_attachment = file_url
+		parent_doc.file_hash = version_doc.file_hash
 		parent_doc.save()
 		
 		return {"status": "success", "version_number": next_version_number}
@@ -204,15 +288,19 @@ def create_new_version(parent_document, file_url, version_notes="", change_summa
 def restore_version(version_name):
 	"""Restore a specific version"""
 	try:
-		version_doc = frappe.get_doc("Archive Document Version", version_name)
-		parent_doc = frappe.get_doc("Archive Document", version_doc.parent)
+		# Only three fields are needed, create_new_version loads and saves the parent itself
+		version = frappe.db.get_value("Archive Document Version", version_name,
+			["parent", "file_url", "version_number"], as_dict=True)
+		
+		if not version:
+			frappe.throw(_("Version {0} not found").format(version_name))
 		
 		# Create a new version with the restored content
 		result = create_new_version(
-			version_doc.parent,
-			version_doc.file_url,
-			f"Restored from version {version_doc.version_number}",
-			f"Restored from version {version_doc.version_number} on {frappe.utils.now()}"
+			version.parent,
+			version.file_url,
+			f"Restored from version {version.version_number}",
+			f"Restored from version {version.version_number} on {frappe.utils.now()}"
 		)
 		
 		return result
@@ -252,4 +340,52 @@ def check_file_integrity(version_name):
 		return {"status": "success", "integrity_status": integrity_status}
 	except Exception as e:
 		frappe.log_error(f"Error checking file integrity: {str(e)}")
-		return {"status": "error", "message": str(e)}
\ No newline at end of file
+		return {"status": "error", "message": str(e)}
+
+@frappe.whitelist()
+def batch_verify_integrity(version_names):
+	"""Check file integrity for many versions, hashing their files in parallel"""
+	try:
+		version_names = frappe.parse_json(version_names)
+		versions = frappe.get_all("Archive Document Version",
+			filters={"name": ["in", version_names]},
+			fields=["name", "file_url", "file_hash", "file_size"]
+		)
+		
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_document.utils import get_site_file_path
+		
+		results = {}
+		checks = []
+		for version in versions:
+			if not version.file_url or not version.file_hash:
+				results[version.name] = "No file or hash available"
+				continue
+			
+			try:
+				file_path = get_site_file_path(version.file_url) or frappe.get_doc("File", {"file_url": version.file_url}).get_full_path()
+			except Exception as e:
+				frappe.log_error(f"File integrity check error for {version.name}: {str(e)}")
+				results[version.name] = "File not found"
+				continue
+			
+			checks.append((version, file_path))
+		
+		# The threads only stat and hash files, every site access stays on this thread
+		with ThreadPoolExecutor(max_workers=INTEGRITY_CHECK_WORKERS) as executor:
+			futures = [
+				(version.name, executor.submit(check_file_integrity_status, file_path, version.file_hash, version.file_size))
+				for version, file_path in checks
+			]
+			
+			for name, future in futures:
+				try:
+					results[name] = future.result()
+				except Exception as e:
+					frappe.log_error(f"File integrity check error for {name}: {str(e)}")
+					results[name] = "Error checking integrity"
+		
+		return {"status": "success", "integrity_status": results}
+		
+	except Exception as e:
+		frappe.log_error(f"Error checking file integrity: {str(e)}")
+		return {"status": "error", "message": str(e)}
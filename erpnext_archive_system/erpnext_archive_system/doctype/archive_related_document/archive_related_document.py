@@ -1,6 +1,33 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from types import MappingProxyType
+
+# The relationship type recorded on the other document, read-only so it can be shared
+REVERSE_RELATIONSHIPS = MappingProxyType({
+	"Supersedes": "Superseded By",
+	"Superseded By": "Supersedes",
+	"References": "Referenced By",
+	"Referenced By": "References",
+	"Part Of": "Contains",
+	"Contains": "Part Of",
+	"Version Of": "Original Of",
+	"Original Of": "Version Of"
+})
+
+# Audit trail action for each relationship event, built once instead of on every save
+RELATIONSHIP_AUDIT_ACTIONS = {
+	"Relationship Created": "Relationship Relationship Created",
+	"Relationship Deleted": "Relationship Relationship Deleted"
+}
+
+# Archive Related Document columns written for the reverse row of add_relationship
+RELATED_DOCUMENT_FIELDS = (
+	"name", "creation", "modified", "owner", "modified_by",
+	"parent", "parentfield", "parenttype",
+	"related_document_id", "relationship_type", "notes",
+	"created_by", "created_on", "last_modified_by", "last_modified_on"
+)
 
 class ArchiveRelatedDocument(Document):
 	def validate(self):
@@ -23,52 +50,64 @@ class ArchiveRelatedDocument(Document):
 	def validate_related_document(self):
 		"""Validate that related document exists and is different from parent"""
 		if self.related_document_id:
-			# Check if related document exists
-			if not frappe.db.exists("Archive Document", self.related_document_id):
-				frappe.throw(_("Related document {0} does not exist").format(self.related_document_id))
-			
 			# Check if it's not the same as parent document
 			if self.parent and self.related_document_id == self.parent:
 				frappe.throw(_("Document cannot be related to itself"))
 			
-			# Check for duplicate relationship
-			existing = frappe.get_all("Archive Related Document",
-				filters={
+			# Documents already found in this request are not looked up again during bulk imports
+			known_documents = frappe.flags.archive_related_documents_found
+			if known_documents is None:
+				known_documents = frappe.flags.archive_related_documents_found = set()
+			
+			if self.related_document_id in known_documents:
+				relationship_exists = frappe.db.exists("Archive Related Document", {
 					"parent": self.parent,
 					"related_document_id": self.related_document_id,
 					"relationship_type": self.relationship_type,
-					"name": ["!=", self.name]
-				}
-			)
+					"name": ["!=", self.name or ""]
+				})
+			else:
+				# Check that the related document exists and the relationship is new in one round trip
+				checks = frappe.db.sql("""
+					SELECT
+						EXISTS(SELECT 1 FROM `tabArchive Document` WHERE name = %s) as document_exists,
+						EXISTS(
+							SELECT 1 FROM `tabArchive Related Document`
+							WHERE parent = %s AND related_document_id = %s
+								AND relationship_type = %s AND name != %s
+						) as relationship_exists
+				""", (self.related_document_id, self.parent, self.related_document_id,
+					self.relationship_type, self.name or ""), as_dict=True)[0]
+				
+				if not checks.document_exists:
+					frappe.throw(_("Related document {0} does not exist").format(self.related_document_id))
+				
+				known_documents.add(self.related_document_id)
+				relationship_exists = checks.relationship_exists
 			
-			if existing:
+			if relationship_exists:
 				frappe.throw(_("This relationship already exists"))
 	
 	def set_audit_info(self):
 		"""Set audit information"""
 		if not self.created_by:
 			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_on = self.modified or frappe.utils.now()
 	
 	def update_modified_info(self):
 		"""Update modification information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
 		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_on = self.modified or frappe.utils.now()
 	
 	def create_relationship_audit_log(self, action):
 		"""Create relationship audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Relationship {action}",
-			"document_id": self.parent,
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Relationship {action}: {self.relationship_type} -> {self.related_document_id}"
-		}
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
 		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		queue_audit_entry(build_audit_entry(RELATIONSHIP_AUDIT_ACTIONS[action],
+			document_id=self.parent,
+			details=f"Relationship {action}: {self.relationship_type} -> {self.related_document_id}"
+		))
 	
 	def get_related_document_info(self):
 		"""Get information about the related document"""
@@ -89,6 +128,12 @@ class ArchiveRelatedDocument(Document):
 @frappe.whitelist()
 def add_relationship(parent_document, related_document_id, relationship_type, notes=""):
 	"""Add a relationship between documents"""
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import discard_audit_entries_since, get_audit_entry_count
+	
+	# The forward and reverse rows and their audit entries are kept or rolled back together
+	frappe.db.savepoint("archive_relationship_pair")
+	audit_entry_count = get_audit_entry_count()
+	
 	try:
 		# Validate parent document exists
 		if not frappe.db.exists("Archive Document", parent_document):
@@ -124,53 +169,95 @@ def add_relationship(parent_document, related_document_id, relationship_type, no
 		relationship_doc.insert(ignore_permissions=True)
 		
 		# Create reverse relationship if applicable
-		reverse_relationships = {
-			"Supersedes": "Superseded By",
-			"Superseded By": "Supersedes",
-			"References": "Referenced By",
-			"Referenced By": "References",
-			"Part Of": "Contains",
-			"Contains": "Part Of",
-			"Version Of": "Original Of",
-			"Original Of": "Version Of"
-		}
-		
-		if relationship_type in reverse_relationships:
-			reverse_relationship_doc = frappe.get_doc({
-				"doctype": "Archive Related Document",
-				"parent": related_document_id,
-				"parentfield": "related_documents",
-				"parenttype": "Archive Document",
-				"related_document_id": parent_document,
-				"relationship_type": reverse_relationships[relationship_type],
-				"notes": f"Reverse of: {notes}" if notes else "Reverse relationship"
-			})
-			
-			reverse_relationship_doc.insert(ignore_permissions=True)
+		if relationship_type in REVERSE_RELATIONSHIPS:
+			insert_reverse_relationship(relationship_doc, notes)
 		
 		return {"status": "success", "message": "Relationship added successfully"}
 		
 	except Exception as e:
+		frappe.db.rollback(save_point="archive_relationship_pair")
+		discard_audit_entries_since(audit_entry_count)
 		frappe.log_error(f"Error adding relationship: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def insert_reverse_relationship(relationship_doc, notes=""):
+	"""Write the reverse row of a validated relationship directly, without a second document insert"""
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+	
+	# Both documents were validated with the forward row, only a duplicate reverse row is left to rule out
+	reverse_type = REVERSE_RELATIONSHIPS[relationship_doc.relationship_type]
+	if frappe.db.exists("Archive Related Document", {
+		"parent": relationship_doc.related_document_id,
+		"related_document_id": relationship_doc.parent,
+		"relationship_type": reverse_type
+	}):
+		return
+	
+	now = relationship_doc.modified
+	user = frappe.session.user
+	frappe.db.bulk_insert("Archive Related Document", RELATED_DOCUMENT_FIELDS, [(
+		frappe.generate_hash(length=10),
+		now,
+		now,
+		user,
+		user,
+		relationship_doc.related_document_id,
+		"related_documents",
+		"Archive Document",
+		relationship_doc.parent,
+		reverse_type,
+		f"Reverse of: {notes}" if notes else "Reverse relationship",
+		user,
+		now,
+		user,
+		now
+	)])
+	
+	queue_audit_entry(build_audit_entry(RELATIONSHIP_AUDIT_ACTIONS["Relationship Created"],
+		document_id=relationship_doc.related_document_id,
+		details=f"Relationship Relationship Created: {reverse_type} -> {relationship_doc.parent}",
+		timestamp=now
+	))
+
 @frappe.whitelist()
 def get_document_relationships(document_id, relationship_type=None):
 	"""Get all relationships for a document"""
 	try:
-		filters = {"parent": document_id}
+		conditions = ""
+		params = [document_id]
 		if relationship_type:
-			filters["relationship_type"] = relationship_type
+			conditions = " AND r.relationship_type = %s"
+			params.append(relationship_type)
 		
-		relationships = frappe.get_all("Archive Related Document",
-			filters=filters,
-			fields=["name", "related_document_id", "relationship_type", "notes", "created_on"],
-			order_by="created_on desc"
-		)
+		# The related documents' details come from the same query instead of one load per relationship
+		rows = frappe.db.sql(f"""
+			SELECT
+				r.name, r.related_document_id, r.relationship_type, r.notes, r.created_on,
+				d.name as related_name, d.document_id, d.document_title, d.category,
+				d.status, d.access_level, d.created_on as document_created_on
+			FROM `tabArchive Related Document` r
+			LEFT JOIN `tabArchive Document` d ON d.name = r.related_document_id
+			WHERE r.parent = %s {conditions}
+			ORDER BY r.created_on DESC
+		""", params, as_dict=True)
 		
-		# Get related document details
-		for rel in relationships:
-			rel["related_document_info"] = get_related_document_info(rel["related_document_id"])
+		relationships = []
+		for row in rows:
+			relationships.append(frappe._dict({
+				"name": row.name,
+				"related_document_id": row.related_document_id,
+				"relationship_type": row.relationship_type,
+				"notes": row.notes,
+				"created_on": row.created_on,
+				"related_document_info": {
+					"document_id": row.document_id,
+					"document_title": row.document_title,
+					"category": row.category,
+					"status": row.status,
+					"access_level": row.access_level,
+					"created_on": row.document_created_on
+				} if row.related_name else {}
+			}))
 		
 		return relationships
 		
@@ -208,23 +295,12 @@ def remove_relationship(relationship_name):
 		relationship_doc.delete()
 		
 		# Remove reverse relationship if it exists
-		reverse_relationships = {
-			"Supersedes": "Superseded By",
-			"Superseded By": "Supersedes",
-			"References": "Referenced By",
-			"Referenced By": "References",
-			"Part Of": "Contains",
-			"Contains": "Part Of",
-			"Version Of": "Original Of",
-			"Original Of": "Version Of"
-		}
-		
-		if relationship_type in reverse_relationships:
+		if relationship_type in REVERSE_RELATIONSHIPS:
 			reverse_relationship = frappe.get_all("Archive Related Document",
 				filters={
 					"parent": related_document,
 					"related_document_id": parent_document,
-					"relationship_type": reverse_relationships[relationship_type]
+					"relationship_type": REVERSE_RELATIONSHIPS[relationship_type]
 				}
 			)
 			
@@ -2,6 +2,12 @@ import frappe
 from frappe.model.document import Document
 from frappe import _
 
+# Audit trail action and details wording for each subcategory event, built once instead of on every save
+SUBCATEGORY_AUDIT_ACTIONS = {
+	"Subcategory Created": ("Subcategory Subcategory Created", "subcategory created"),
+	"Subcategory Deleted": ("Subcategory Subcategory Deleted", "subcategory deleted")
+}
+
 class ArchiveSubcategory(Document):
 	def validate(self):
 		"""Validate subcategory before saving"""
@@ -32,8 +38,12 @@ class ArchiveSubcategory(Document):
 	def validate_parent_category(self):
 		"""Validate parent category exists and is active"""
 		if self.parent_category:
-			parent = frappe.get_doc("Archive Category", self.parent_category)
-			if not parent.is_active:
+			from erpnext_archive_system.erpnext_archive_system.api.archive_api import ARCHIVE_CATEGORY_ACTIVE_CACHE_KEY
+			
+			# Subcategory imports check the same few categories over and over
+			is_active = frappe.cache().hget(ARCHIVE_CATEGORY_ACTIVE_CACHE_KEY, self.parent_category,
+				generator=lambda: frappe.db.get_value("Archive Category", self.parent_category, "is_active"))
+			if not is_active:
 				frappe.throw(_("Parent category is not active"))
 	
 	def set_default_values(self):
@@ -48,12 +58,13 @@ class ArchiveSubcategory(Document):
 		"""Set audit information"""
 		if not self.created_by:
 			self.created_by = frappe.session.user
-			self.created_on = frappe.utils.now()
+			self.created_on = self.modified or frappe.utils.now()
 	
 	def update_modified_info(self):
 		"""Update modification information"""
+		# The save already stamped modified, reuse it instead of reading the clock again
 		self.last_modified_by = frappe.session.user
-		self.last_modified_on = frappe.utils.now()
+		self.last_modified_on = self.modified or frappe.utils.now()
 	
 	def validate_subcategory_deletion(self):
 		"""Validate if subcategory can be deleted"""
@@ -64,18 +75,14 @@ class ArchiveSubcategory(Document):
 	
 	def create_subcategory_audit_log(self, action):
 		"""Create subcategory audit log entry"""
-		audit_entry = {
-			"doctype": "Archive Audit Trail",
-			"action": f"Subcategory {action}",
-			"category_id": self.parent_category,
-			"user": frappe.session.user,
-			"timestamp": frappe.utils.now(),
-			"ip_address": frappe.local.request.environ.get('REMOTE_ADDR') if frappe.local.request else "System",
-			"details": f"Subcategory '{self.subcategory_name}' {action.lower()}"
-		}
-		
-		audit_doc = frappe.get_doc(audit_entry)
-		audit_doc.insert(ignore_permissions=True)
+		from erpnext_archive_system.erpnext_archive_system.doctype.archive_audit_trail.archive_audit_trail import build_audit_entry, queue_audit_entry
+		
+		audit_action, event = SUBCATEGORY_AUDIT_ACTIONS[action]
+		
+		queue_audit_entry(build_audit_entry(audit_action,
+			category_id=self.parent_category,
+			details=f"Subcategory '{self.subcategory_name}' {event}"
+		))
 	
 	def get_document_count(self):
 		"""Get count of documents in this subcategory"""
@@ -135,15 +142,22 @@ def create_subcategory(subcategory_name, parent_category, **kwargs):
 def get_subcategories_by_category(category_name):
 	"""Get all subcategories for a specific category"""
 	try:
-		subcategories = frappe.get_all("Archive Subcategory",
-			filters={"parent_category": category_name, "is_active": 1},
-			fields=["name", "subcategory_name", "subcategory_code", "description", "color", "icon"],
-			order_by="subcategory_name"
-		)
-		
-		# Add document count for each subcategory
-		for subcategory in subcategories:
-			subcategory["document_count"] = frappe.db.count("Archive Document", {"subcategory": subcategory.name})
+		# Document counts come from the same query instead of one COUNT per subcategory
+		subcategories = frappe.db.sql("""
+			SELECT
+				s.name,
+				s.subcategory_name,
+				s.subcategory_code,
+				s.description,
+				s.color,
+				s.icon,
+				COUNT(d.name) as document_count
+			FROM `tabArchive Subcategory` s
+			LEFT JOIN `tabArchive Document` d ON d.subcategory = s.name
+			WHERE s.parent_category = %s AND s.is_active = 1
+			GROUP BY s.name
+			ORDER BY s.subcategory_name
+		""", (category_name,), as_dict=True)
 		
 		return subcategories
 		
@@ -181,6 +195,7 @@ def get_subcategory_statistics():
 def get_subcategory_hierarchy():
 	"""Get complete subcategory hierarchy"""
 	try:
+		# Documents are counted per subcategory before the join, so the hierarchy rows are never multiplied out
 		hierarchy = frappe.db.sql("""
 			SELECT 
 				c.name as category_name,
@@ -189,21 +204,25 @@ def get_subcategory_hierarchy():
 				s.name as subcategory_name,
 				s.subcategory_name as subcategory_display_name,
 				s.color as subcategory_color,
-				COUNT(d.name) as document_count
+				COALESCE(d.document_count, 0) as document_count
 			FROM `tabArchive Category` c
-			LEFT JOIN `tabArchive Subcategory` s ON c.name = s.parent_category
-			LEFT JOIN `tabArchive Document` d ON s.name = d.subcategory
-			WHERE c.is_active = 1 AND (s.is_active = 1 OR s.is_active IS NULL)
-			GROUP BY c.name, c.category_name, c.color, s.name, s.subcategory_name, s.color
+			LEFT JOIN `tabArchive Subcategory` s ON c.name = s.parent_category AND s.is_active = 1
+			LEFT JOIN (
+				SELECT subcategory, COUNT(*) as document_count
+				FROM `tabArchive Document`
+				WHERE subcategory IS NOT NULL
+				GROUP BY subcategory
+			) d ON d.subcategory = s.name
+			WHERE c.is_active = 1
 			ORDER BY c.category_name, s.subcategory_name
 		""", as_dict=True)
 		
 		# Organize into hierarchical structure
 		categories = {}
 		for item in hierarchy:
-			category_name = item.category_name
-			if category_name not in categories:
-				categories[category_name] = {
+			category = categories.get(item.category_name)
+			if category is None:
+				category = categories[item.category_name] = {
 					"category_name": item.category_display_name,
 					"color": item.category_color,
 					"subcategories": [],
@@ -211,12 +230,12 @@ def get_subcategory_hierarchy():
 				}
 			
 			if item.subcategory_name:
-				categories[category_name]["subcategories"].append({
+				category["subcategories"].append({
 					"subcategory_name": item.subcategory_display_name,
 					"color": item.subcategory_color,
 					"document_count": item.document_count
 				})
-				categories[category_name]["total_documents"] += item.document_count
+				category["total_documents"] += item.document_count
 		
 		return list(categories.values())
 		
@@ -2,6 +2,216 @@ import frappe
 from frappe import _
 import os
 
+# Controller methods that fill in a seed record's defaults and audit fields, the rest of validate only checks user input
+SEED_RECORD_METHODS = ("set_default_values", "set_audit_info", "update_modified_info")
+
+# Categories created on install
+DEFAULT_CATEGORIES = (
+	{
+		"category_name": "Financial",
+		"category_code": "FIN",
+		"description": "Financial documents and records",
+		"color": "#e74c3c",
+		"icon": "fas fa-dollar-sign",
+		"retention_policy": 7
+	},
+	{
+		"category_name": "Legal",
+		"category_code": "LEG",
+		"description": "Legal documents and contracts",
+		"color": "#9b59b6",
+		"icon": "fas fa-gavel",
+		"retention_policy": 10
+	},
+	{
+		"category_name": "HR",
+		"category_code": "HR",
+		"description": "Human resources documents",
+		"color": "#3498db",
+		"icon": "fas fa-users",
+		"retention_policy": 7
+	},
+	{
+		"category_name": "Technical",
+		"category_code": "TECH",
+		"description": "Technical documentation and specifications",
+		"color": "#f39c12",
+		"icon": "fas fa-cogs",
+		"retention_policy": 5
+	},
+	{
+		"category_name": "Administrative",
+		"category_code": "ADMIN",
+		"description": "Administrative documents and procedures",
+		"color": "#95a5a6",
+		"icon": "fas fa-clipboard",
+		"retention_policy": 3
+	},
+	{
+		"category_name": "General",
+		"category_code": "GEN",
+		"description": "General documents",
+		"color": "#2ecc71",
+		"icon": "fas fa-file",
+		"retention_policy": 5
+	}
+)
+
+# Document types created on install
+DEFAULT_DOCUMENT_TYPES = (
+	{
+		"document_type_name": "Invoice",
+		"document_type_code": "INV",
+		"description": "Financial invoices and bills",
+		"allowed_file_types": "pdf,jpg,png",
+		"max_file_size": 10,
+		"requires_ocr": True,
+		"retention_period": 7,
+		"access_level": "Internal",
+		"encryption_required": False,
+		"compliance_required": True,
+		"icon": "fas fa-file-invoice"
+	},
+	{
+		"document_type_name": "Contract",
+		"document_type_code": "CON",
+		"description": "Legal contracts and agreements",
+		"allowed_file_types": "pdf,doc,docx",
+		"max_file_size": 25,
+		"requires_ocr": True,
+		"retention_period": 10,
+		"access_level": "Confidential",
+		"encryption_required": True,
+		"compliance_required": True,
+		"icon": "fas fa-file-contract"
+	},
+	{
+		"document_type_name": "Employee Record",
+		"document_type_code": "EMP",
+		"description": "Employee personal records",
+		"allowed_file_types": "pdf,jpg,png,doc,docx",
+		"max_file_size": 15,
+		"requires_ocr": True,
+		"retention_period": 7,
+		"access_level": "Confidential",
+		"encryption_required": True,
+		"compliance_required": True,
+		"icon": "fas fa-user"
+	},
+	{
+		"document_type_name": "Technical Manual",
+		"document_type_code": "TECH",
+		"description": "Technical documentation and manuals",
+		"allowed_file_types": "pdf,doc,docx,txt",
+		"max_file_size": 50,
+		"requires_ocr": False,
+		"retention_period": 5,
+		"access_level": "Internal",
+		"encryption_required": False,
+		"compliance_required": False,
+		"icon": "fas fa-book"
+	},
+	{
+		"document_type_name": "Policy Document",
+		"document_type_code": "POL",
+		"description": "Company policies and procedures",
+		"allowed_file_types": "pdf,doc,docx",
+		"max_file_size": 20,
+		"requires_ocr": False,
+		"retention_period": 3,
+		"access_level": "Internal",
+		"encryption_required": False,
+		"compliance_required": False,
+		"icon": "fas fa-clipboard-list"
+	}
+)
+
+# Roles created on install
+DEFAULT_ROLES = (
+	{
+		"role_name": "Archive User",
+		"desk_access": 1,
+		"is_custom": 1,
+		"restrict_to_domain": None
+	},
+	{
+		"role_name": "Archive Viewer",
+		"desk_access": 1,
+		"is_custom": 1,
+		"restrict_to_domain": None
+	},
+	{
+		"role_name": "Archive Manager",
+		"desk_access": 1,
+		"is_custom": 1,
+		"restrict_to_domain": None
+	}
+)
+
+# Auto-categorization rules created on install
+DEFAULT_CATEGORY_RULES = (
+	{
+		"rule_name": "Financial Documents",
+		"rule_type": "Keyword",
+		"category": "Financial",
+		"keyword": "invoice",
+		"priority": 1,
+		"description": "Auto-categorize documents containing 'invoice' as Financial"
+	},
+	{
+		"rule_name": "Legal Documents",
+		"rule_type": "Keyword",
+		"category": "Legal",
+		"keyword": "contract",
+		"priority": 1,
+		"description": "Auto-categorize documents containing 'contract' as Legal"
+	},
+	{
+		"rule_name": "HR Documents",
+		"rule_type": "Keyword",
+		"category": "HR",
+		"keyword": "employee",
+		"priority": 1,
+		"description": "Auto-categorize documents containing 'employee' as HR"
+	},
+	{
+		"rule_name": "Technical Documents",
+		"rule_type": "Keyword",
+		"category": "Technical",
+		"keyword": "manual",
+		"priority": 1,
+		"description": "Auto-categorize documents containing 'manual' as Technical"
+	}
+)
+
+# Sample subcategories, created under the default category of the same name
+SAMPLE_SUBCATEGORIES = (
+	{
+		"subcategory_name": "Invoices",
+		"parent_category": "Financial",
+		"description": "Customer and vendor invoices",
+		"color": "#e74c3c"
+	},
+	{
+		"subcategory_name": "Contracts",
+		"parent_category": "Legal",
+		"description": "Legal contracts and agreements",
+		"color": "#9b59b6"
+	},
+	{
+		"subcategory_name": "Employee Files",
+		"parent_category": "HR",
+		"description": "Individual employee records",
+		"color": "#3498db"
+	},
+	{
+		"subcategory_name": "User Manuals",
+		"parent_category": "Technical",
+		"description": "User and technical manuals",
+		"color": "#f39c12"
+	}
+)
+
 def after_install():
 	"""Setup tasks after app installation"""
 	
@@ -23,173 +233,38 @@ def after_install():
 	# Create sample data
 	create_sample_data()
 	
+	# Generate the file encryption key
+	from erpnext_archive_system.erpnext_archive_system.doctype.archive_document.utils import ensure_encryption_key
+	ensure_encryption_key()
+	
+	# Create database indexes
+	from erpnext_archive_system.erpnext_archive_system.install.after_migrate import create_indexes
+	create_indexes()
+	
 	frappe.db.commit()
 	frappe.msgprint(_("Archive System installed successfully!"))
 
 def create_default_categories():
 	"""Create default categories"""
-	default_categories = [
-		{
-			"category_name": "Financial",
-			"category_code": "FIN",
-			"description": "Financial documents and records",
-			"color": "#e74c3c",
-			"icon": "fas fa-dollar-sign",
-			"retention_policy": 7
-		},
-		{
-			"category_name": "Legal",
-			"category_code": "LEG",
-			"description": "Legal documents and contracts",
-			"color": "#9b59b6",
-			"icon": "fas fa-gavel",
-			"retention_policy": 10
-		},
-		{
-			"category_name": "HR",
-			"category_code": "HR",
-			"description": "Human resources documents",
-			"color": "#3498db",
-			"icon": "fas fa-users",
-			"retention_policy": 7
-		},
-		{
-			"category_name": "Technical",
-			"category_code": "TECH",
-			"description": "Technical documentation and specifications",
-			"color": "#f39c12",
-			"icon": "fas fa-cogs",
-			"retention_policy": 5
-		},
-		{
-			"category_name": "Administrative",
-			"category_code": "ADMIN",
-			"description": "Administrative documents and procedures",
-			"color": "#95a5a6",
-			"icon": "fas fa-clipboard",
-			"retention_policy": 3
-		},
-		{
-			"category_name": "General",
-			"category_code": "GEN",
-			"description": "General documents",
-			"color": "#2ecc71",
-			"icon": "fas fa-file",
-			"retention_policy": 5
-		}
-	]
-	
-	for category_data in default_categories:
-		if not frappe.db.exists("Archive Category", {"category_name": category_data["category_name"]}):
-			category = frappe.get_doc({
-				"doctype": "Archive Category",
-				**category_data
-			})
-			category.insert(ignore_permissions=True)
+	existing = get_existing_seed_names("Archive Category", "category_name", DEFAULT_CATEGORIES)
+	insert_seed_records("Archive Category", [
+		category_data for category_data in DEFAULT_CATEGORIES
+		if category_data["category_name"] not in existing
+	])
 
 def create_default_document_types():
 	"""Create default document types"""
-	default_types = [
-		{
-			"document_type_name": "Invoice",
-			"document_type_code": "INV",
-			"description": "Financial invoices and bills",
-			"allowed_file_types": "pdf,jpg,png",
-			"max_file_size": 10,
-			"requires_ocr": True,
-			"retention_period": 7,
-			"access_level": "Internal",
-			"encryption_required": False,
-			"compliance_required": True,
-			"icon": "fas fa-file-invoice"
-		},
-		{
-			"document_type_name": "Contract",
-			"document_type_code": "CON",
-			"description": "Legal contracts and agreements",
-			"allowed_file_types": "pdf,doc,docx",
-			"max_file_size": 25,
-			"requires_ocr": True,
-			"retention_period": 10,
-			"access_level": "Confidential",
-			"encryption_required": True,
-			"compliance_required": True,
-			"icon": "fas fa-file-contract"
-		},
-		{
-			"document_type_name": "Employee Record",
-			"document_type_code": "EMP",
-			"description": "Employee personal records",
-			"allowed_file_types": "pdf,jpg,png,doc,docx",
-			"max_file_size": 15,
-			"requires_ocr": True,
-			"retention_period": 7,
-			"access_level": "Confidential",
-			"encryption_required": True,
-			"compliance_required": True,
-			"icon": "fas fa-user"
-		},
-		{
-			"document_type_name": "Technical Manual",
-			"document_type_code": "TECH",
-			"description": "Technical documentation and manuals",
-			"allowed_file_types": "pdf,doc,docx,txt",
-			"max_file_size": 50,
-			"requires_ocr": False,
-			"retention_period": 5,
-			"access_level": "Internal",
-			"encryption_required": False,
-			"compliance_required": False,
-			"icon": "fas fa-book"
-		},
-		{
-			"document_type_name": "Policy Document",
-			"document_type_code": "POL",
-			"description": "Company policies and procedures",
-			"allowed_file_types": "pdf,doc,docx",
-			"max_file_size": 20,
-			"requires_ocr": False,
-			"retention_period": 3,
-			"access_level": "Internal",
-			"encryption_required": False,
-			"compliance_required": False,
-			"icon": "fas fa-clipboard-list"
-		}
-	]
-	
-	for type_data in default_types:
-		if not frappe.db.exists("Archive Document Type", {"document_type_name": type_data["document_type_name"]}):
-			doc_type = frappe.get_doc({
-				"doctype": "Archive Document Type",
-				**type_data
-			})
-			doc_type.insert(ignore_permissions=True)
+	existing = get_existing_seed_names("Archive Document Type", "document_type_name", DEFAULT_DOCUMENT_TYPES)
+	insert_seed_records("Archive Document Type", [
+		type_data for type_data in DEFAULT_DOCUMENT_TYPES
+		if type_data["document_type_name"] not in existing
+	])
 
 def create_default_roles():
 	"""Create default roles for the archive system"""
-	roles = [
-		{
-			"role_name": "Archive User",
-			"desk_access": 1,
-			"is_custom": 1,
-			"restrict_to_domain": None
-		},
-		{
-			"role_name": "Archive Viewer",
-			"desk_access": 1,
-			"is_custom": 1,
-			"restrict_to_domain": None
-		},
-		{
-			"role_name": "Archive Manager",
-			"desk_access": 1,
-			"is_custom": 1,
-			"restrict_to_domain": None
-		}
-	]
-	
-	for role_data in roles:
-		if not frappe.db.exists("Role", role_data["role_name"]):
+	existing = get_existing_seed_names("Role", "role_name", DEFAULT_ROLES)
+	for role_data in DEFAULT_ROLES:
+		if role_data["role_name"] not in existing:
 			role = frappe.get_doc({
 				"doctype": "Role",
 				**role_data
@@ -198,44 +273,11 @@ def create_default_roles():
 
 def create_default_category_rules():
 	"""Create default auto-categorization rules"""
-	rules = [
-		{
-			"rule_name": "Financial Documents",
-			"rule_type": "Keyword",
-			"keyword": "invoice",
-			"priority": 1,
-			"description": "Auto-categorize documents containing 'invoice' as Financial"
-		},
-		{
-			"rule_name": "Legal Documents",
-			"rule_type": "Keyword",
-			"keyword": "contract",
-			"priority": 1,
-			"description": "Auto-categorize documents containing 'contract' as Legal"
-		},
-		{
-			"rule_name": "HR Documents",
-			"rule_type": "Keyword",
-			"keyword": "employee",
-			"priority": 1,
-			"description": "Auto-categorize documents containing 'employee' as HR"
-		},
-		{
-			"rule_name": "Technical Documents",
-			"rule_type": "Keyword",
-			"keyword": "manual",
-			"priority": 1,
-			"description": "Auto-categorize documents containing 'manual' as Technical"
-		}
-	]
-	
-	for rule_data in rules:
-		if not frappe.db.exists("Archive Category Rule", {"rule_name": rule_data["rule_name"]}):
-			rule = frappe.get_doc({
-				"doctype": "Archive Category Rule",
-				**rule_data
-			})
-			rule.insert(ignore_permissions=True)
+	existing = get_existing_seed_names("Archive Category Rule", "rule_name", DEFAULT_CATEGORY_RULES)
+	insert_seed_records("Archive Category Rule", [
+		rule_data for rule_data in DEFAULT_CATEGORY_RULES
+		if rule_data["rule_name"] not in existing
+	])
 
 def setup_permissions():
 	"""Setup default permissions for roles"""
@@ -245,46 +287,70 @@ def setup_permissions():
 
 def create_sample_data():
 	"""Create sample data for demonstration"""
-	# Create sample subcategories
-	sample_subcategories = [
-		{
-			"subcategory_name": "Invoices",
-			"parent_category": "Financial",
-			"description": "Customer and vendor invoices",
-			"color": "#e74c3c"
-		},
-		{
-			"subcategory_name": "Contracts",
-			"parent_category": "Legal",
-			"description": "Legal contracts and agreements",
-			"color": "#9b59b6"
-		},
-		{
-			"subcategory_name": "Employee Files",
-			"parent_category": "HR",
-			"description": "Individual employee records",
-			"color": "#3498db"
-		},
-		{
-			"subcategory_name": "User Manuals",
-			"parent_category": "Technical",
-			"description": "User and technical manuals",
-			"color": "#f39c12"
-		}
-	]
+	existing = get_existing_seed_names("Archive Subcategory", "subcategory_name", SAMPLE_SUBCATEGORIES)
+	
+	# Already seeded, as on a reinstall or a restored site
+	if len(existing) == len(SAMPLE_SUBCATEGORIES):
+		return
 	
-	for subcategory_data in sample_subcategories:
-		# Get parent category
-		parent_category = frappe.get_value("Archive Category", 
-			{"category_name": subcategory_data["parent_category"]}, "name")
+	# Resolve every parent category name in one query
+	parent_categories = {
+		category.category_name: category.name
+		for category in frappe.get_all("Archive Category",
+			filters={"category_name": ["in", [data["parent_category"] for data in SAMPLE_SUBCATEGORIES]]},
+			fields=["name", "category_name"]
+		)
+	}
+	
+	subcategories = []
+	for subcategory_data in SAMPLE_SUBCATEGORIES:
+		parent_category = parent_categories.get(subcategory_data["parent_category"])
 		
-		if parent_category and not frappe.db.exists("Archive Subcategory", 
-			{"subcategory_name": subcategory_data["subcategory_name"]}):
-			subcategory = frappe.get_doc({
-				"doctype": "Archive Subcategory",
+		if parent_category and subcategory_data["subcategory_name"] not in existing:
+			subcategories.append({
 				"subcategory_name": subcategory_data["subcategory_name"],
 				"parent_category": parent_category,
 				"description": subcategory_data["description"],
 				"color": subcategory_data["color"]
 			})
-			subcategory.insert(ignore_permissions=True)
\ No newline at end of file
+	
+	insert_seed_records("Archive Subcategory", subcategories)
+
+def get_existing_seed_names(doctype, fieldname, records):
+	"""Return which of the seed records already exist, with one query bounded to their names"""
+	return set(frappe.get_all(doctype,
+		filters={fieldname: ["in", [record[fieldname] for record in records]]},
+		pluck=fieldname
+	))
+
+def insert_seed_records(doctype, records):
+	"""Insert fixed seed records with one multi-row INSERT instead of a full document insert each"""
+	if not records:
+		return
+	
+	now = frappe.utils.now()
+	user = frappe.session.user
+	docs = []
+	for record in records:
+		doc = frappe.new_doc(doctype)
+		doc.update(record)
+		doc.set_new_name()
+		doc.creation = doc.modified = now
+		doc.owner = doc.modified_by = user
+		
+		for method in SEED_RECORD_METHODS:
+			if hasattr(doc, method):
+				getattr(doc, method)()
+		
+		docs.append(doc)
+	
+	fields = list(docs[0].get_valid_dict(convert_dates_to_str=True))
+	frappe.db.bulk_insert(doctype, fields, [
+		tuple(doc.get_valid_dict(convert_dates_to_str=True).get(field) for field in fields)
+		for doc in docs
+	])
+	
+	# The insert hooks still record each audit entry and clear the cached lookup lists
+	for doc in docs:
+		doc.run_method("after_insert")
+		doc.run_method("on_update")
\ No newline at end of file
@@ -0,0 +1,87 @@
+import frappe
+
+def after_migrate():
+	"""Setup tasks after every migration"""
+	
+	# Create database indexes that cannot be declared in DocType JSON
+	create_indexes()
+
+def create_indexes():
+	"""Create all custom database indexes"""
+	create_search_indexes()
+	create_statistics_indexes()
+	create_lookup_indexes()
+	create_audit_trail_indexes()
+	create_version_indexes()
+	create_relationship_indexes()
+
+def create_search_indexes():
+	"""Create the indexes used by document search"""
+	if frappe.db.db_type == "postgres":
+		# Prefix LIKE on document_id needs a pattern ops index outside the C locale
+		frappe.db.sql_ddl("""
+			CREATE INDEX IF NOT EXISTS archive_document_id_pattern
+			ON "tabArchive Document" (document_id text_pattern_ops)
+		""")
+		return
+	
+	if frappe.db.has_index("tabArchive Document", "archive_document_fulltext"):
+		return
+	
+	frappe.db.sql_ddl("""
+		ALTER TABLE `tabArchive Document`
+		ADD FULLTEXT INDEX archive_document_fulltext (document_title, ocr_text, tags, description)
+	""")
+
+def create_statistics_indexes():
+	"""Create covering indexes for the dashboard statistics queries"""
+	frappe.db.add_index("Archive Document",
+		["category", "status", "access_level", "encryption_status"],
+		index_name="archive_document_statistics"
+	)
+	frappe.db.add_index("Archive Document",
+		["document_type", "status", "access_level"],
+		index_name="archive_document_type_statistics"
+	)
+
+def create_lookup_indexes():
+	"""Create indexes for the active category and document type lists"""
+	frappe.db.add_index("Archive Category",
+		["is_active", "category_name"],
+		index_name="archive_category_active"
+	)
+	frappe.db.add_index("Archive Document Type",
+		["is_active", "document_type_name"],
+		index_name="archive_document_type_active"
+	)
+
+def create_audit_trail_indexes():
+	"""Create indexes for the filtered audit trail listings and the retention cleanup"""
+	for field in ("document_id", "category_id", "user", "action"):
+		frappe.db.add_index("Archive Audit Trail",
+			[field, "timestamp"],
+			index_name=f"archive_audit_trail_{field}_timestamp"
+		)
+	
+	frappe.db.add_index("Archive Audit Trail",
+		["retention_until"],
+		index_name="archive_audit_trail_retention_until"
+	)
+
+def create_version_indexes():
+	"""Create the indexes used to find a document's current and latest versions"""
+	frappe.db.add_index("Archive Document Version",
+		["parent", "is_current_version"],
+		index_name="archive_document_version_current"
+	)
+	frappe.db.add_index("Archive Document Version",
+		["parent", "version_number"],
+		index_name="archive_document_version_number"
+	)
+
+def create_relationship_indexes():
+	"""Create the index used by the duplicate relationship checks"""
+	frappe.db.add_index("Archive Related Document",
+		["parent", "related_document_id", "relationship_type"],
+		index_name="archive_related_document_lookup"
+	)
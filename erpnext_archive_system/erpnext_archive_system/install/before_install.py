@@ -1,5 +1,21 @@
 import frappe
 from frappe import _
+import importlib.util
+import sys
+
+# Python versions the app runs on, Frappe 15 itself needs 3.10 or later
+SUPPORTED_PYTHON_VERSIONS = frozenset({(3, 10), (3, 11), (3, 12)})
+
+# Required pip packages and the module each one installs
+REQUIRED_PACKAGES = {
+	"Pillow": "PIL",
+	"pytesseract": "pytesseract",
+	"opencv-python": "cv2",
+	"cryptography": "cryptography",
+	"elasticsearch": "elasticsearch",
+	"redis": "redis",
+	"celery": "celery"
+}
 
 def before_install():
 	"""Pre-installation checks and setup"""
@@ -33,24 +49,12 @@ def check_erpnext_version():
 
 def check_python_dependencies():
 	"""Check if required Python packages are available"""
-	required_packages = [
-		"Pillow",
-		"pytesseract", 
-		"opencv-python",
-		"cryptography",
-		"elasticsearch",
-		"redis",
-		"celery"
+	# find_spec only locates the module, none of the packages are imported just to check them
+	missing_packages = [
+		package for package, module in REQUIRED_PACKAGES.items()
+		if importlib.util.find_spec(module) is None
 	]
 	
-	missing_packages = []
-	
-	for package in required_packages:
-		try:
-			__import__(package.replace("-", "_"))
-		except ImportError:
-			missing_packages.append(package)
-	
 	if missing_packages:
 		frappe.throw(_("Missing required Python packages: {0}. Please install them using: pip install {1}").format(
 			", ".join(missing_packages), " ".join(missing_packages)
@@ -60,22 +64,18 @@ def check_python_dependencies():
 
 def check_system_requirements():
 	"""Check system requirements"""
-	import os
-	import platform
+	import shutil
 	
-	# Check available disk space
-	try:
-		disk_usage = os.statvfs('/')
-		free_space_gb = (disk_usage.f_frsize * disk_usage.f_bavail) / (1024**3)
-		
-		if free_space_gb < 1:  # Require at least 1GB free space
-			frappe.msgprint(_("Warning: Low disk space detected. Archive system may require significant storage."))
-	except:
-		pass
+	# Check available disk space on the partition holding the site's files
+	free_space_gb = shutil.disk_usage(frappe.get_site_path()).free / (1024**3)
+	
+	if free_space_gb < 1:  # Require at least 1GB free space
+		frappe.msgprint(_("Warning: Low disk space detected. Archive system may require significant storage."))
 	
 	# Check Python version
-	python_version = platform.python_version()
-	if not python_version.startswith("3.8") and not python_version.startswith("3.9") and not python_version.startswith("3.10"):
-		frappe.msgprint(_("Warning: Python version {0} may not be fully compatible. Recommended: Python 3.8-3.10").format(python_version))
+	if sys.version_info[:2] not in SUPPORTED_PYTHON_VERSIONS:
+		frappe.msgprint(_("Warning: Python version {0} may not be fully compatible. Recommended: Python 3.10-3.12").format(
+			"{0}.{1}.{2}".format(*sys.version_info[:3])
+		))
 	
 	frappe.msgprint(_("System requirements check completed"))
\ No newline at end of file
@@ -1 +1,6 @@
 console.log("ERPNext Archive System assets loaded");
+
+// OCR and encryption results are pushed over realtime, from the request or the background job
+frappe.realtime.on("archive_progress", (data) => {
+	frappe.show_alert({ message: data.message, indicator: data.indicator || "green" }, 5);
+});
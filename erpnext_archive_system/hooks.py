@@ -56,8 +56,9 @@ app_include_js = "/assets/erpnext_archive_system/js/erpnext_archive_system.js"
 # Installation
 # ------------
 
-before_install = "erpnext_archive_system.install.before_install"
-after_install = "erpnext_archive_system.install.after_install"
+before_install = "erpnext_archive_system.erpnext_archive_system.install.before_install.before_install"
+after_install = "erpnext_archive_system.erpnext_archive_system.install.after_install.after_install"
+after_migrate = "erpnext_archive_system.erpnext_archive_system.install.after_migrate.after_migrate"
 
 # Uninstallation
 # ------------
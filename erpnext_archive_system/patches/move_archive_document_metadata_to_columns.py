@@ -0,0 +1,26 @@
+import frappe
+
+def execute():
+	"""Copy the old metadata JSON of archive documents into the file_size, file_type and last_accessed columns"""
+	if not frappe.db.has_column("Archive Document", "metadata"):
+		return
+	
+	if frappe.db.db_type == "postgres":
+		frappe.db.sql("""
+			UPDATE "tabArchive Document"
+			SET file_size = CAST(metadata::json->>'file_size' AS BIGINT),
+				file_type = LEFT(metadata::json->>'file_type', 10),
+				last_accessed = CAST(metadata::json->>'last_accessed' AS TIMESTAMP)
+			WHERE metadata IS NOT NULL AND metadata != ''
+		""")
+	else:
+		frappe.db.sql("""
+			UPDATE `tabArchive Document`
+			SET file_size = JSON_VALUE(metadata, '$.file_size'),
+				file_type = LEFT(JSON_VALUE(metadata, '$.file_type'), 10),
+				last_accessed = JSON_VALUE(metadata, '$.last_accessed')
+			WHERE metadata IS NOT NULL AND metadata != ''
+		""")
+	
+	# The values now live in their own columns, nothing reads the JSON anymore
+	frappe.db.sql_ddl("ALTER TABLE `tabArchive Document` DROP COLUMN metadata")
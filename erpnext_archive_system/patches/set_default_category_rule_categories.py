@@ -0,0 +1,17 @@
+import frappe
+
+def execute():
+	"""Give the default categorization rules seeded before rules had a category the category they were written for"""
+	from erpnext_archive_system.erpnext_archive_system.install.after_install import DEFAULT_CATEGORY_RULES
+	
+	# Rules are named after rule_name
+	default_categories = {rule_data["rule_name"]: rule_data["category"] for rule_data in DEFAULT_CATEGORY_RULES}
+	rules = frappe.get_all("Archive Category Rule",
+		filters={"name": ["in", list(default_categories)]},
+		fields=["name", "category"]
+	)
+	
+	for rule in rules:
+		category = default_categories[rule.name]
+		if not rule.category and frappe.db.exists("Archive Category", category):
+			frappe.db.set_value("Archive Category Rule", rule.name, "category", category, update_modified=False)